@@ -1,22 +1,50 @@
-import re
-import string
-import data
+import bisect
+import collections
+import operator
+
+try:
+    from . import data, cache
+except (ImportError, ValueError):
+    # imported from inside the package directory, not as part of the package
+    import data
+    import cache
+
+class _LazyPattern(object):
+    """A regular expression that is only compiled (and the re module only
+    imported) the first time it is used, to keep importing bible fast"""
+    
+    def __init__(self, pattern):
+        self.pattern = pattern
+    
+    def __getattr__(self, name):
+        import re
+        
+        # keep the compiled pattern's attribute, so we only get here once
+        value = getattr(re.compile(self.pattern), name)
+        setattr(self, name, value)
+        return value
 
 # regular expressions for matching a valid normalized verse string
-verse_re = re.compile(r'^\d{1,2}-\d{1,3}-\d{1,3}(-[a-zA-Z]{2,})?$')
+verse_re = _LazyPattern(r'^\d{1,2}-\d{1,3}-\d{1,3}(-[a-zA-Z]{2,})?$')
 
 # regular expressions for identifying book, and chapter:verse references
-book_re = re.compile(r'^\d*[a-zA-Z ]*')
-ref_re = re.compile(r'\d{1,3}:\d{1,3}')
-translation_re = re.compile(r'[a-zA-Z]{2,}$')
+book_re = _LazyPattern(r'^\d*[a-zA-Z ]*')
+ref_re = _LazyPattern(r'\d{1,3}:\d{1,3}')
+translation_re = _LazyPattern(r'[a-zA-Z]{2,}$')
 
 class RangeError(Exception):
     """Exception class for books, verses, and chapters out of range"""
     pass
+
+# an invalid reference found by parse_many(errors='collect') - index is the
+# position of the value in the input, message is the error Verse would raise
+InvalidReference = collections.namedtuple('InvalidReference', 'index value message')
     
 class Verse(object):
     """Class to represent a Bible reference (book, chapter, and verse)"""
     
+    __slots__ = ('book', 'chapter', 'verse', 'translation')
+    
     def __init__(self, *args):
         """Create a new Verse object - accepts several different inputs:
         
@@ -43,90 +71,124 @@ class Verse(object):
             else:
                 self.translation = None
             
-        # if we only got one value, lets try to figure it out
+        # if we only got one value, lets try to figure it out - this also
+        # makes sure the verse exists
         elif len(args) == 1:
-            
-            # maybe we got a normalized b-c-v(-t) string
-            try:
-                
-                # check to make sure we have a valid verse string
-                if not verse_re.search(args[0]):
-                    raise Exception('String should be in normalized b-c-v(-t) format.')
-
-                # extract the parts from the string
-                parts = args[0].split('-')
-                self.book, self.chapter, self.verse = map(int, parts[:3])
-                if len(parts) > 3:
-                    self.translation = parts[3]
-                else:
-                    self.translation = None
-            
-            # if not, let's try to extract the values
-            except:
-
-                # find the book reference
-                try:
-                    b = book_re.search(args[0]).group(0)
-                except:
-                    raise RangeError("We can't find that book of the Bible: %s" % (args[0]))
-
-                # find the chapter:verse reference
-                try:
-                    ref = ref_re.search(args[0]).group(0)
-                except:
-                    raise Exception("We can't make sense of your chapter:verse reference")
-
-                # find the translation, if provided
-                try:
-                    self.translation = translation_re.search(args[0]).group(0).upper()
-                except:
-                    self.translation = None
-                
-                # try to find the book listed as a book name or abbreviation
-                self.bible = data.bible_data(self.translation)
-                b = b.rstrip('.').lower().strip()
-                for i, book in enumerate(self.bible):
-                    if book['name'].lower() == b:
-                        found = i + 1
-                        break
-                    else:
-                        for abbr in book['abbrs']:
-                            if abbr == b:
-                                found = i + 1
-                                break
-                try:
-                    self.book = found
-                except:
-                    raise RangeError("We can't find that book of the Bible!: " + b)
-
-                # extract chapter and verse from ref
-                self.chapter, self.verse = map(int, ref.split(':'))
-        
-        # if we didn't add the bible attribute above, add it now
-        if 'bible' not in self.__dict__:
-            self.bible = data.bible_data(self.translation)
-        
-        # check to see if the chapter is in range for the given book
-        try:
-            verse_count = self.bible[self.book - 1]['verse_counts'][self.chapter - 1]
-        except:
-            raise RangeError("There are not that many chapters in" + self.bible[self.book - 1]['name'])
-
-        # check to see if the verse is in range for the given chapter
-        if verse_count < self.verse:
-            raise RangeError("There is no verse %s in %s %s" % (self.verse, self.bible[self.book - 1]['name'], self.chapter))
+            ref, err = _parse_and_check(args[0])
+            if err:
+                raise err[0](err[1])
+            self.book, self.chapter, self.verse, self.translation = ref
+            return
+        
+        # make sure the book, chapter, and verse exist in the translation
+        err = _check_reference(data.canon(self.translation), self.book, self.chapter, self.verse, self.translation)
+        if err:
+            raise err[0](err[1])
+    
+    @classmethod
+    def _from_parts(cls, book, chapter, verse, translation):
+        """Create a Verse from values that have already been checked"""
+        
+        v = cls.__new__(cls)
+        v.book = book
+        v.chapter = chapter
+        v.verse = verse
+        v.translation = translation
+        return v
+    
+    @classmethod
+    def from_normalized(cls, value):
+        """Create a new Verse object from a normalized b-c-v(-t) string (see
+        __str__) - this skips the free text parsing and never raises an
+        exception. Returns None if the string is not a normalized string
+        for a verse that exists"""
         
-        # check to see if the specified verse is omitted
         try:
-            omitted = self.verse in self.bible[self.book - 1]['omissions'][self.chapter-1]
-            try:
-                err = 'This verse is omitted from the %s translation.' % self.translation
-            except:
-                err = 'This verse is omitted from all modern translations.'
-        except:
-            omitted = False
-        if omitted:
-            raise RangeError(err)
+            ref = _parse_normalized(value)
+        except TypeError:
+            return None
+        if ref is None or _check_reference(data.canon(ref[3]), *ref):
+            return None
+        return cls._from_parts(*ref)
+    
+    @classmethod
+    def try_parse(cls, value):
+        """Create a new Verse object from any string Verse() accepts, but
+        return None instead of raising an exception if it is not valid"""
+        
+        ref, err = _parse_and_check(value)
+        if err:
+            return None
+        return cls._from_parts(*ref)
+    
+    @classmethod
+    def from_ordinal(cls, ordinal, translation=None):
+        """Create a new Verse object from its ordinal (see Verse.ordinal)"""
+        
+        ref = data.reference(ordinal, translation)
+        if ref is None:
+            raise RangeError("There is no verse with the ordinal %s in the Bible" % ordinal)
+        
+        # make sure the verse is not omitted from the translation
+        err = _check_reference(data.canon(translation), ref[0], ref[1], ref[2], translation)
+        if err:
+            raise err[0](err[1])
+        return cls._from_parts(ref[0], ref[1], ref[2], translation)
+    
+    @property
+    def bible(self):
+        """The shared canon data for the verse's translation"""
+        return data.canon(self.translation)
+    
+    @property
+    def ordinal(self):
+        """The index of the verse in the canon, counting from 0 for Genesis 1:1
+        Omitted verses keep their place, so ordinals are the same in every
+        translation with the same books, and they sort in canonical order"""
+        return data.ordinal(self.book, self.chapter, self.verse, self.translation)
+    
+    def offset(self, n):
+        """Return the verse n verses after this one (or before it, if n is
+        negative), across chapters and books and skipping verses omitted
+        from the translation. Raises RangeError past either end of the Bible"""
+        
+        translation = self.translation
+        rank = data.rank(self.ordinal, translation) + n
+        if not 0 <= rank < data.rank(data.ordinal_tables(translation)[3], translation):
+            raise RangeError("There is no verse %s verses from %s" % (n, self.format()))
+        ref = data.reference(data.unrank(rank, translation), translation)
+        return Verse._from_parts(ref[0], ref[1], ref[2], translation)
+    
+    def to_translation(self, translation):
+        """Return the same verse in another translation - see
+        data.mapping_table(). Raises RangeError if the translation omits it"""
+        
+        ordinal = data.map_ordinal(self.ordinal, self.translation, translation)
+        if ordinal is None:
+            raise RangeError('This verse is omitted from the %s translation.' % translation)
+        ref = data.reference(ordinal, translation)
+        return Verse._from_parts(ref[0], ref[1], ref[2], translation)
+    
+    def same_verse(self, other):
+        """Check to see if two verses are the same verse, even if they are
+        from different translations"""
+        
+        if self.translation == other.translation:
+            return self.ordinal == other.ordinal
+        return data.map_ordinal(other.ordinal, other.translation, self.translation) == self.ordinal
+    
+    def next(self):
+        """Return the next verse in the translation - see offset()"""
+        return self.offset(1)
+    
+    def prev(self):
+        """Return the previous verse in the translation - see offset()"""
+        return self.offset(-1)
+    
+    def __reduce__(self):
+        if self.translation:
+            return (Verse, (self.book, self.chapter, self.verse, self.translation))
+        return (Verse, (self.book, self.chapter, self.verse))
             
     def __unicode__(self):
         return self.format()
@@ -135,15 +197,7 @@ class Verse(object):
         """Return a formatted string to represent the verse
         Letters are substituted for verse attributes, like date formatting"""
         
-        # create blank string to hold output
-        f = ""
-        
-        # iterate over letters in val string passed in to method
-        for c in val:
-            f += _format_char(self, c)
-        
-        # return the formatted value
-        return f.strip()
+        return _compile_format(val, False)(self)
     
     def __eq__(self, other):
         if type(self) != type(other):
@@ -158,6 +212,40 @@ class Verse(object):
     def __ne__(self, other):
         return not self.__eq__(other)
     
+    def __hash__(self):
+        # verses that differ only by translation share a hash, which is fine
+        return self.ordinal
+    
+    def _compare(self, other):
+        """Compare two verses in canonical order - returns a negative number,
+        zero, or a positive number. Verses in the same place in different
+        translations are ordered by translation (no translation first)"""
+        
+        diff = self.ordinal - other.ordinal
+        if diff or self.translation == other.translation:
+            return diff
+        return -1 if (self.translation or '') < (other.translation or '') else 1
+    
+    def __lt__(self, other):
+        if not isinstance(other, Verse):
+            return NotImplemented
+        return self._compare(other) < 0
+    
+    def __le__(self, other):
+        if not isinstance(other, Verse):
+            return NotImplemented
+        return self._compare(other) <= 0
+    
+    def __gt__(self, other):
+        if not isinstance(other, Verse):
+            return NotImplemented
+        return self._compare(other) > 0
+    
+    def __ge__(self, other):
+        if not isinstance(other, Verse):
+            return NotImplemented
+        return self._compare(other) >= 0
+    
     def __str__(self):
         """Casts a verse object into a normalized string
         This is especially useful for saving to a database"""
@@ -175,15 +263,28 @@ class Verse(object):
 class Passage(object):
     """A passage of scripture with start and end verses"""
     
-    def __init__(self, start, end):
+    __slots__ = ('start', 'end')
+    
+    def __init__(self, start, end=None):
         """Create a new Passage object - accepts Verse objects or any
-        string inputs that can process into valid Verse objects
+        string inputs that can process into valid Verse objects, or a
+        normalized passage string on its own (see __str__)
         
         Examples: v1 = Verse('Rom. 1:1')
                   v2 = Verse('Rom. 1:8')
                   Passage(v1, v2)
                   
-                  Passage('Rom. 1:1', 'Rom. 1:8')"""
+                  Passage('Rom. 1:1', 'Rom. 1:8')
+                  
+                  Passage('45-1-1 45-1-8')"""
+        
+        # a normalized "start end" string
+        if end is None:
+            verses = _parse_normalized_passage(start)
+            if verses is None:
+                raise Exception("We can't make sense of your passage: %r" % (start,))
+            self.start, self.end = verses
+            return
         
         # if the args passed were Verse objects, add them to the Passage
         # directly, otherwise try to interpret them as strings  
@@ -199,8 +300,27 @@ class Passage(object):
         # make sure start and end verses are in the same translation
         if self.start.translation != self.end.translation:
             raise Exception('Verse must be in the same translation to form a Passage')
-        else:
-            self.bible = self.start.bible
+    
+    @classmethod
+    def from_normalized(cls, value):
+        """Create a new Passage object from a normalized "start end" string
+        (see __str__) without the free text parsing - returns None if the
+        string is not a normalized string for a passage that exists"""
+        
+        verses = _parse_normalized_passage(value)
+        if verses is None:
+            return None
+        p = cls.__new__(cls)
+        p.start, p.end = verses
+        return p
+    
+    @property
+    def bible(self):
+        """The shared canon data for the passage's translation"""
+        return self.start.bible
+    
+    def __reduce__(self):
+        return (Passage, (self.start, self.end))
     
     def __unicode__(self):
         return self._smart_format()
@@ -248,63 +368,35 @@ class Passage(object):
     def __len__(self):
         """Count the total number of verses in the passage"""
         
-        # start and end are in the same book
-        if self.start.book == self.end.book:
-            
-            # start and end are in the same chapter of the same book
-            if self.start.chapter == self.end.chapter:
-                count = self._count_verses(
-                    self.start.book,
-                    self.start.chapter,
-                    self.start.verse,
-                    self.end.verse,
-                )
-            
-            # start and end are in different chapters of the same book
-            else:
-                
-                # get number of verses in start chapter
-                count = self._count_verses(
-                    self.start.book,
-                    self.start.chapter,
-                    start=self.start.verse,
-                )
-                
-                # add number of verses in whole chapters between start and end
-                for chapter in range(self.start.chapter + 1, self.end.chapter):
-                    count += self._count_verses(self.start.book, chapter)
-                
-                # add the number of verses in the end chapter
-                count += self._count_verses(
-                    self.end.book,
-                    self.end.chapter,
-                    end=self.end.verse,
-                )
-        
-        # start and end are in different books
-        else:
-            
-            # get number of verses in first chapter of start book
-            count = self._count_verses(self.start.book, self.start.chapter, start=self.start.verse)
-            
-            # add number of verses in whole chapters of start book
-            for chapter in range(self.start.chapter + 1, len(self.bible[self.start.book - 1]['verse_counts']) + 1):
-                count += self._count_verses(self.start.book, chapter)
-            
-            # add total number of verses in whole books between start and end
-            for book in range(self.start.book + 1, self.end.book):
-                for chapter in range(1, len(self.bible[book - 1]['verse_counts']) + 1):
-                    count += self._count_verses(book, chapter)
-            
-            # add number of verses in whole chapters of end book
-            for chapter in range(1, self.end.chapter):
-                count += self._count_verses(self.end.book, chapter)
-            
-            # get the number of verses in last chapter of end book
-            count += self._count_verses(self.end.book, self.end.chapter, end=self.end.verse)
+        # the rank of a verse is the number of non-omitted verses before it
+        translation = self.start.translation
+        count = (data.rank(self.end.ordinal + 1, translation) -
+                 data.rank(self.start.ordinal, translation))
+        return max(count, 0)
+    
+    def to_translation(self, translation):
+        """Return the same passage in another translation - start and end
+        verses omitted from the translation are moved inwards to the nearest
+        verses it has. Raises RangeError if it omits the whole passage"""
         
-        # return the count
-        return count
+        table = data.mapping_table(self.start.translation, translation)
+        first = self.start.ordinal
+        last = self.end.ordinal
+        while first <= last and table[first] < 0:
+            first += 1
+        while last >= first and table[last] < 0:
+            last -= 1
+        if first > last:
+            raise RangeError('This passage is omitted from the %s translation.' % translation)
+        start = data.reference(table[first], translation)
+        end = data.reference(table[last], translation)
+        return Passage(Verse._from_parts(start[0], start[1], start[2], translation),
+                       Verse._from_parts(end[0], end[1], end[2], translation))
+    
+    def __iter__(self):
+        """Iterate over the verses in the passage, in order, leaving out
+        verses omitted from the translation"""
+        return _walk(self.start.ordinal, self.end.ordinal, self.start.translation)
     
     def __eq__(self, other):
         if type(self) != type(other):
@@ -319,10 +411,40 @@ class Passage(object):
     def __ne__(self, other):
         return not self.__eq__(other)
     
+    def __hash__(self):
+        return (self.start.ordinal << 20) ^ self.end.ordinal
+    
+    def _compare(self, other):
+        """Compare two passages in canonical order of their start verses,
+        then their end verses - returns a negative number, zero, or a
+        positive number"""
+        
+        return self.start._compare(other.start) or self.end._compare(other.end)
+    
+    def __lt__(self, other):
+        if not isinstance(other, Passage):
+            return NotImplemented
+        return self._compare(other) < 0
+    
+    def __le__(self, other):
+        if not isinstance(other, Passage):
+            return NotImplemented
+        return self._compare(other) <= 0
+    
+    def __gt__(self, other):
+        if not isinstance(other, Passage):
+            return NotImplemented
+        return self._compare(other) > 0
+    
+    def __ge__(self, other):
+        if not isinstance(other, Passage):
+            return NotImplemented
+        return self._compare(other) >= 0
+    
     def __str__(self):
         """Casts a passage object into a normalized string
-        This would be useful for saving to a database if the __init__ for this
-        class accepted the string as input - need to add that capability"""
+        This is especially useful for saving to a database - Passage() and
+        Passage.from_normalized() accept the string back"""
         
         return str(self.start) + ' ' + str(self.end)
     
@@ -330,25 +452,19 @@ class Passage(object):
         """counts the number of non-omitted verses in a singler chapter or range of
         verses from a chapter"""
         
-        # get book data
-        book = self.bible[book - 1]
+        # count a whole chapter straight from the tables
+        translation = self.start.translation
+        if not start and not end:
+            return data.verse_count(book, chapter, translation)
         
-        # create list with all verses to look at
+        # otherwise count between the ordinals of the first and last verses
         if not start:
             start = 1
         if not end:
-            end = book['verse_counts'][chapter - 1]
-        verses = range(start, end + 1)
-        
-        # remove omissions from list of verses
-        if 'omissions' in book and len(book['omissions']) >= chapter:
-            omissions = book['omissions'][chapter-1]
-            for v in omissions:
-                if v in verses:
-                    verses.remove(v)
-        
-        # send back a count of the verses that survived
-        return len(verses)
+            end = self.bible[book - 1]['verse_counts'][chapter - 1]
+        first = data.ordinal(book, chapter, start, translation)
+        last = data.ordinal(book, chapter, end, translation)
+        return max(data.rank(last + 1, translation) - data.rank(first, translation), 0)
     
     def format(self, val=None):
         """Return a formatted string to represent the passage
@@ -358,21 +474,7 @@ class Passage(object):
         
         # if we got a string, process it and return formatted verse
         if val:
-            
-            # create blank string to hold output
-            f = ""
-        
-            # iterate over letters in val string passed in to method
-            for c in val:
-                if c == "P":
-                    f += self._smart_format()
-                elif c.isupper():
-                    f += _format_char(self.start, c)
-                else:
-                    f += _format_char(self.end, c)
-        
-            # return formatted string
-            return f.strip()
+            return _compile_format(val, True)(self)
         
         # if we didn't get a formatting string, send back the _smart_format()
         else:
@@ -392,14 +494,19 @@ class Passage(object):
              End:    Rom. 1:1
              Output: Acts 1:1 - Romans 1:1"""
         
+        return _compile_format(self._smart_template(), True)(self)
+    
+    def _smart_template(self):
+        """Return the format string _smart_format() uses for the passage"""
+        
         # a single verse, not a true passage
         if self.start == self.end:
             
             # No chapters, ie: 2 John, 3 John, Jude...
             if len(self.start.bible[self.start.book-1]['verse_counts']) == 1:
-                f = self.format('B V')
+                f = 'B V'
             
-            f = self.format('B C:V')
+            f = 'B C:V'
         
         # start and end are in the same book
         elif self.start.book == self.end.book:
@@ -409,34 +516,451 @@ class Passage(object):
                 
                 # No chapters.
                 if len(self.start.bible[self.start.book-1]['verse_counts']) == 1:
-                    f = self.format('B V-v')
+                    f = 'B V-v'
                 else:
-                    f = self.format('B C:V-v')
+                    f = 'B C:V-v'
             
             # start and end are in different chapters of the same book
             else:
-                f = self.format('B C:V - c:v')
+                f = 'B C:V - c:v'
         
         # start and end are in different books
         else:
             # No chapters.
             if len(self.start.bible[self.start.book-1]['verse_counts']) == 1 and len(self.end.bible[self.end.book-1]['verse_counts']) == 1:
-                f = self.format('B V - b v')
+                f = 'B V - b v'
             
              # No chapters in start.
             elif len(self.start.bible[self.start.book-1]['verse_counts']) == 1:
-                f = self.format('B V - b c:v')
+                f = 'B V - b c:v'
             
             # No chapters in end.
             elif len(self.end.bible[self.end.book-1]['verse_counts']) == 1:
-                f = self.format('B C:V - b v')
+                f = 'B C:V - b v'
             else:
-                f = self.format('B C:V - b c:v')
+                f = 'B C:V - b c:v'
         
-        # return the formatted value
+        # return the format string
         return f
 
 
+
+class PassageSet(object):
+    """A set of verses made up of any number of passages, e.g. the verses
+    in "Rom 1:1-5, 8-10; 2:3" - accepts Verse, Passage, and PassageSet
+    objects, or any strings that can process into valid Verse objects
+    
+    Examples: PassageSet([Passage('Rom 1:1', 'Rom 1:5'), Verse('Rom 2:3')])
+              PassageSet(['Rom 1:1', 'Rom 1:2'], translation='ESV')
+    
+    The verses are stored as sorted, merged ranges of ordinals, so sets can
+    be combined with | (union), & (intersection), and - (difference) in
+    linear time, and membership is checked with a binary search. Like
+    Passage, every verse must be from the same translation. PassageSet
+    objects can not be changed - the operators return new sets."""
+    
+    __slots__ = ('translation', '_starts', '_ends')
+    
+    def __init__(self, references=(), translation=None):
+        
+        # collect a (start, end) range of ordinals for each reference
+        ranges = []
+        for ref in references:
+            if isinstance(ref, PassageSet):
+                translation = _same_translation(translation, ref.translation)
+                ranges.extend(zip(ref._starts, ref._ends))
+                continue
+            if not isinstance(ref, (Verse, Passage)):
+                ref = Verse(ref)
+            if isinstance(ref, Verse):
+                translation = _same_translation(translation, ref.translation)
+                ranges.append((ref.ordinal, ref.ordinal + 1))
+            else:
+                translation = _same_translation(translation, ref.start.translation)
+                ranges.append((ref.start.ordinal, ref.end.ordinal + 1))
+        
+        self.translation = translation
+        self._set_ranges(ranges)
+    
+    @classmethod
+    def _from_ranges(cls, ranges, translation):
+        """Create a PassageSet from (start, end) ordinal ranges"""
+        
+        s = cls.__new__(cls)
+        s.translation = translation
+        s._set_ranges(ranges)
+        return s
+    
+    def _set_ranges(self, ranges):
+        """Store sorted, merged ranges - a range covers ordinals start up to
+        (but not including) end. Omitted verses are trimmed from the ends of
+        ranges, and ranges only separated by omitted verses are merged"""
+        
+        translation = self.translation
+        rank = data.rank
+        starts = []
+        ends = []
+        for start, end in sorted(ranges):
+            
+            # trim omitted verses from both ends of the range
+            while start < end and rank(start + 1, translation) == rank(start, translation):
+                start += 1
+            while start < end and rank(end, translation) == rank(end - 1, translation):
+                end -= 1
+            if start >= end:
+                continue
+            
+            # merge with the previous range if no verses come between them
+            if ends and rank(start, translation) <= rank(ends[-1], translation):
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        
+        self._starts = tuple(starts)
+        self._ends = tuple(ends)
+    
+    @property
+    def ranges(self):
+        """A tuple of (first, last) ordinals for each range of verses"""
+        return tuple((start, end - 1) for start, end in zip(self._starts, self._ends))
+    
+    def passages(self):
+        """Return a list with a Passage for each range of verses in the set"""
+        
+        translation = self.translation
+        make = Verse.from_ordinal
+        return [Passage(make(start, translation), make(end - 1, translation))
+                for start, end in zip(self._starts, self._ends)]
+    
+    def __iter__(self):
+        """Iterate over the passages in the set, in canonical order"""
+        return iter(self.passages())
+    
+    def __len__(self):
+        """Count the total number of verses in the set"""
+        
+        rank = data.rank
+        translation = self.translation
+        count = 0
+        for start, end in zip(self._starts, self._ends):
+            count += rank(end, translation) - rank(start, translation)
+        return count
+    
+    def __bool__(self):
+        return bool(self._starts)
+    __nonzero__ = __bool__
+    
+    def __contains__(self, reference):
+        """Check to see if a Verse (or every verse in a Passage) is in the set"""
+        
+        if isinstance(reference, Passage):
+            first, last = reference.start.ordinal, reference.end.ordinal
+        else:
+            first = last = reference.ordinal
+            if self.translation and first in data.omitted_ordinals(self.translation):
+                return False
+        
+        # find the last range starting at or before the first verse
+        i = bisect.bisect_right(self._starts, first) - 1
+        return i >= 0 and last < self._ends[i]
+    
+    def _combine(self, other):
+        """Check the other set can be combined with this one, and return
+        the translation for the result"""
+        
+        if not isinstance(other, PassageSet):
+            other = PassageSet([other])
+        if not self._starts:
+            return other, other.translation
+        if not other._starts:
+            return other, self.translation
+        return other, _same_translation(self.translation, other.translation)
+    
+    def union(self, other):
+        """Return a new set with the verses in either set"""
+        
+        other, translation = self._combine(other)
+        ranges = list(zip(self._starts, self._ends))
+        ranges.extend(zip(other._starts, other._ends))
+        return PassageSet._from_ranges(ranges, translation)
+    
+    def intersection(self, other):
+        """Return a new set with the verses in both sets"""
+        
+        other, translation = self._combine(other)
+        a_starts, a_ends = self._starts, self._ends
+        b_starts, b_ends = other._starts, other._ends
+        ranges = []
+        i = j = 0
+        while i < len(a_starts) and j < len(b_starts):
+            start = max(a_starts[i], b_starts[j])
+            end = min(a_ends[i], b_ends[j])
+            if start < end:
+                ranges.append((start, end))
+            
+            # move past whichever range finishes first
+            if a_ends[i] < b_ends[j]:
+                i += 1
+            else:
+                j += 1
+        return PassageSet._from_ranges(ranges, translation)
+    
+    def difference(self, other):
+        """Return a new set with the verses in this set but not the other"""
+        
+        other, translation = self._combine(other)
+        b_starts, b_ends = other._starts, other._ends
+        ranges = []
+        j = 0
+        for start, end in zip(self._starts, self._ends):
+            
+            # skip the ranges of the other set that end before this one
+            while j < len(b_starts) and b_ends[j] <= start:
+                j += 1
+            
+            # cut out each range of the other set that overlaps this one
+            k = j
+            while k < len(b_starts) and b_starts[k] < end:
+                if b_starts[k] > start:
+                    ranges.append((start, b_starts[k]))
+                start = max(start, b_ends[k])
+                k += 1
+            if start < end:
+                ranges.append((start, end))
+        return PassageSet._from_ranges(ranges, translation)
+    
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    
+    def isdisjoint(self, other):
+        """Check to see if the two sets have no verses in common"""
+        return not self.intersection(other)
+    
+    def __eq__(self, other):
+        if type(self) != type(other):
+            return False
+        
+        # translation and ranges of verses must be equal.
+        return (self.translation, self._starts, self._ends) == (other.translation, other._starts, other._ends)
+    
+    def __ne__(self, other):
+        return not self.__eq__(other)
+    
+    def __hash__(self):
+        return hash((self.translation, self._starts, self._ends))
+    
+    def __reduce__(self):
+        return (_passage_set, (list(zip(self._starts, self._ends)), self.translation))
+    
+    def __str__(self):
+        """Casts a passage set into a normalized string - the normalized
+        strings of each passage, separated by commas"""
+        
+        return ', '.join(str(p) for p in self.passages())
+    
+    def __unicode__(self):
+        return self.format()
+    
+    def format(self, val=None):
+        """Return a formatted string to represent the set - each passage is
+        formatted with Passage.format(val) and separated by semicolons"""
+        
+        return '; '.join(p.format(val) for p in self.passages())
+
+
+def _same_translation(translation, other):
+    """Return the translation shared by a set and a reference added to it"""
+    
+    if translation is None:
+        return other
+    if other is not None and other != translation:
+        raise Exception('Verses must be in the same translation to form a PassageSet')
+    return translation
+
+def _passage_set(ranges, translation):
+    """Return a PassageSet from its ranges, when it is unpickled - Python 2
+    can't pickle a class method"""
+    return PassageSet._from_ranges(ranges, translation)
+
+
+def parse_many(references, errors='raise'):
+    """Parse an iterable of reference strings (a list, a file, etc.) into
+    Verse objects - accepts the same strings as Verse()
+    
+    This is a generator, so references are read and parsed one at a time.
+    Surrounding whitespace (like the newline on a line from a file) is
+    ignored. The errors argument decides what happens to invalid references:
+    
+    'raise'   - raise the same exception Verse() would (the default)
+    'skip'    - leave them out of the results
+    'collect' - yield an InvalidReference(index, value, message) in their place"""
+    
+    if errors not in ('raise', 'skip', 'collect'):
+        raise ValueError("errors must be 'raise', 'skip', or 'collect'")
+    
+    parse = _parse_and_check
+    make = Verse._from_parts
+    
+    for i, value in enumerate(references):
+        try:
+            value = value.strip()
+        except AttributeError:
+            pass
+        
+        # parse the string, and make sure the verse exists
+        ref, err = parse(value)
+        if not err:
+            yield make(*ref)
+            continue
+        
+        # deal with the invalid reference
+        if errors == 'raise':
+            raise err[0](err[1])
+        elif errors == 'collect':
+            yield InvalidReference(i, value, err[1])
+
+
+def format_many(references, val=None, out=None):
+    """Format many Verse and Passage objects at once - the format string is
+    compiled once and used for every reference. Passages are given their
+    _smart_format() when there is no format string, and verses use the
+    Verse.format() default
+    
+    Returns a list of the formatted strings, or if out is a writable text
+    stream (like an open file), writes each string to it on its own line
+    and returns the number of lines written."""
+    
+    format_verse = _compile_format(val or "B C:V", False)
+    format_passage = _compile_format(val, True) if val else None
+    strings = []
+    count = 0
+    
+    for ref in references:
+        if isinstance(ref, Verse):
+            strings.append(format_verse(ref))
+        elif format_passage:
+            strings.append(format_passage(ref))
+        else:
+            strings.append(_compile_format(ref._smart_template(), True)(ref))
+        
+        # write to the stream in chunks, rather than building one big list
+        if out is not None and len(strings) == 1000:
+            out.write('\n'.join(strings) + '\n')
+            count += len(strings)
+            strings = []
+    
+    if out is None:
+        return strings
+    if strings:
+        out.write('\n'.join(strings) + '\n')
+    return count + len(strings)
+
+def smart_format_many(passages, out=None):
+    """Return (or write to out) the _smart_format() string for many Passage
+    objects at once - see format_many()"""
+    
+    return format_many(passages, None, out)
+
+
+def translate_many(references, translation, errors='raise'):
+    """Convert many Verse and Passage objects to another translation (see
+    Verse.to_translation) - the mapping table is looked up once for each
+    source translation, and nothing is parsed again
+    
+    This is a generator. The errors argument decides what happens to
+    references the translation omits, as for parse_many()"""
+    
+    if errors not in ('raise', 'skip', 'collect'):
+        raise ValueError("errors must be 'raise', 'skip', or 'collect'")
+    
+    tables = {}
+    for i, ref in enumerate(references):
+        if isinstance(ref, Passage):
+            try:
+                yield ref.to_translation(translation)
+            except RangeError as e:
+                if errors == 'raise':
+                    raise
+                elif errors == 'collect':
+                    yield InvalidReference(i, ref, str(e))
+            continue
+        
+        # look up the verse in the table for its translation
+        source = ref.translation
+        if source not in tables:
+            tables[source] = data.mapping_table(source, translation)
+        ordinal = tables[source][ref.ordinal]
+        if ordinal >= 0:
+            b, c, v = data.reference(ordinal, translation)
+            yield Verse._from_parts(b, c, v, translation)
+            continue
+        
+        message = 'This verse is omitted from the %s translation.' % translation
+        if errors == 'raise':
+            raise RangeError(message)
+        elif errors == 'collect':
+            yield InvalidReference(i, ref, message)
+
+def iter_chapter(book, chapter, translation=None):
+    """Iterate over the verses of a chapter, leaving out verses omitted from
+    the translation. Raises RangeError if the chapter does not exist"""
+    
+    bible = data.canon(translation)
+    if not 1 <= book <= len(bible):
+        raise RangeError("There is no book %s in the Bible" % book)
+    if not 1 <= chapter <= len(bible[book - 1]['verse_counts']):
+        raise RangeError("There are not that many chapters in " + bible[book - 1]['name'])
+    first = data.ordinal(book, chapter, 1, translation)
+    last = first + bible[book - 1]['verse_counts'][chapter - 1] - 1
+    return _walk(first, last, translation)
+
+def iter_book(book, translation=None):
+    """Iterate over the verses of a book, leaving out verses omitted from
+    the translation. Raises RangeError if the book does not exist"""
+    
+    bible = data.canon(translation)
+    if not 1 <= book <= len(bible):
+        raise RangeError("There is no book %s in the Bible" % book)
+    counts = bible[book - 1]['verse_counts']
+    first = data.ordinal(book, 1, 1, translation)
+    last = data.ordinal(book, len(counts), counts[-1], translation)
+    return _walk(first, last, translation)
+
+def _walk(first, last, translation):
+    """Yield a Verse for each ordinal from first to last (inclusive) that is
+    not omitted from the translation - steps through the canon tables one
+    verse at a time, rather than looking up each ordinal"""
+    
+    if first > last:
+        return
+    bible = data.canon(translation)
+    omitted = data.omitted_ordinals(translation)
+    skip = bisect.bisect_left(omitted, first)
+    make = Verse._from_parts
+    
+    book, chapter, verse = data.reference(first, translation)
+    counts = bible[book - 1]['verse_counts']
+    count = counts[chapter - 1]
+    for ordinal in range(first, last + 1):
+        if skip < len(omitted) and omitted[skip] == ordinal:
+            skip += 1
+        else:
+            yield make(book, chapter, verse, translation)
+        
+        # move on to the next chapter, or the next book
+        verse += 1
+        if verse > count and ordinal < last:
+            verse = 1
+            chapter += 1
+            if chapter > len(counts):
+                chapter = 1
+                book += 1
+                counts = bible[book - 1]['verse_counts']
+            count = counts[chapter - 1]
+
+
 def _format_char(verse, char):
     """return a string for the part of a verse represented by a
     formatting char:
@@ -465,4 +989,198 @@ def _format_char(verse, char):
         except:
             return ""
     else:
-        return char
\ No newline at end of file
+        return char
+
+
+# compiled format strings, by (format string, is passage) - see _compile_format()
+_format_cache = cache.LRUCache(256)
+
+# functions to get the part of a verse represented by each formatting char
+_format_getters = {
+    'A': lambda verse: verse.bible[verse.book-1]['abbrs'][0].title(),
+    'B': lambda verse: verse.bible[verse.book-1]['name'],
+    'C': operator.attrgetter('chapter'),
+    'V': operator.attrgetter('verse'),
+    'T': operator.attrgetter('translation'),
+}
+
+def _compile_format(val, passage):
+    """Return a function that formats a Verse (or a Passage, if passage is
+    True) with the format string val, giving the same output as applying
+    _format_char() to each char. Compiled format strings are cached"""
+    
+    key = (val, passage)
+    render = _format_cache.get(key)
+    if render is not None:
+        return render
+    
+    # turn the format string into a %-style template and a list of
+    # functions that get the value for each %s in it
+    template = []
+    getters = []
+    for c in val:
+        if passage and c == "P":
+            getter = Passage._smart_format
+        else:
+            getter = _format_getters.get(c.upper())
+            if getter and passage:
+                if c.isupper():
+                    getter = _on_start(getter)
+                else:
+                    getter = _on_end(getter)
+        if getter:
+            template.append('%s')
+            getters.append(getter)
+        else:
+            template.append(c.replace('%', '%%'))
+    template = ''.join(template)
+    
+    def render(obj):
+        return (template % tuple([get(obj) for get in getters])).strip()
+    
+    return _format_cache.put(key, render)
+
+def _on_start(getter):
+    """Make a formatting function for a verse work on a passage's start verse"""
+    return lambda passage: getter(passage.start)
+
+def _on_end(getter):
+    """Make a formatting function for a verse work on a passage's end verse"""
+    return lambda passage: getter(passage.end)
+
+
+# cache of _parse_and_check() results by input string - see enable_parse_cache()
+_parse_cache = None
+
+def enable_parse_cache(maxsize=1024):
+    """Start caching the results of parsing reference strings, so parsing a
+    string that has been seen before skips all of the work. The cache holds
+    up to maxsize strings (throwing away the least recently used) and is
+    returned, so you can check cache.hits and cache.misses, or clear() it.
+    Every Verse is still a new object, so changing one can not affect others"""
+    
+    global _parse_cache
+    _parse_cache = cache.LRUCache(maxsize)
+    return _parse_cache
+
+def disable_parse_cache():
+    """Stop caching the results of parsing reference strings"""
+    
+    global _parse_cache
+    _parse_cache = None
+
+def parse_cache():
+    """Return the parse cache if it is enabled, otherwise None"""
+    return _parse_cache
+
+def _clear_parse_cache():
+    """Throw away cached results when the translation data changes"""
+    if _parse_cache is not None:
+        _parse_cache.clear()
+
+data.add_reset_hook(_clear_parse_cache)
+
+def _parse_and_check(value):
+    """Parse a reference string with _parse_reference() and make sure the
+    verse exists - returns (values, None) or (None, (exception class,
+    message)). Results, including errors, come from the parse cache if it
+    is enabled"""
+    
+    results = _parse_cache
+    if results is not None:
+        try:
+            result = results.get(value)
+        except TypeError:
+            results = result = None
+        if result is not None:
+            return result
+    
+    result = ref, err = _parse_reference(value)
+    if not err:
+        err = _check_reference(data.canon(ref[3]), *ref)
+        if err:
+            result = None, err
+    
+    if results is not None:
+        results.put(value, result)
+    return result
+
+def _parse_normalized(value):
+    """Split a normalized b-c-v(-t) string into (book, chapter, verse,
+    translation), or return None if the string is not normalized"""
+    
+    if not verse_re.search(value):
+        return None
+    parts = value.split('-')
+    if len(parts) > 3:
+        return int(parts[0]), int(parts[1]), int(parts[2]), parts[3]
+    return int(parts[0]), int(parts[1]), int(parts[2]), None
+
+def _parse_normalized_passage(value):
+    """Return the (start, end) Verse objects for a normalized "start end"
+    passage string, or None if it is not one for a passage that exists"""
+    
+    try:
+        start, end = value.split(' ')
+    except (AttributeError, TypeError, ValueError):
+        return None
+    start = Verse.from_normalized(start)
+    end = Verse.from_normalized(end)
+    if start is None or end is None or start.translation != end.translation:
+        return None
+    return start, end
+
+def _parse_reference(value):
+    """Split a reference string into (book, chapter, verse, translation)
+    
+    Accepts the same strings as Verse(). Nothing is raised - returns a tuple
+    of (values, None) on success, or (None, (exception class, message))"""
+    
+    # maybe we got a normalized b-c-v(-t) string
+    try:
+        ref = _parse_normalized(value)
+    except TypeError:
+        return None, (RangeError, "We can't find that book of the Bible: %s" % (value,))
+    if ref:
+        return ref, None
+    
+    # if not, let's try to extract the values - find the chapter:verse reference
+    match = ref_re.search(value)
+    if not match:
+        return None, (Exception, "We can't make sense of your chapter:verse reference")
+    chapter, verse = match.group(0).split(':')
+    
+    # find the translation, if provided
+    match = translation_re.search(value)
+    translation = match.group(0).upper() if match else None
+    
+    # find the book listed as a book name or abbreviation (in the translation)
+    b = book_re.search(value).group(0)
+    book = data.find_book(b, translation=translation)
+    if book is None:
+        return None, (RangeError, "We can't find that book of the Bible!: " + b.strip())
+    
+    return (book, int(chapter), int(verse), translation), None
+
+def _check_reference(bible, book, chapter, verse, translation):
+    """Check that a verse exists in the canon data for its translation
+    
+    Returns None for a valid verse, or (exception class, message)"""
+    
+    # check to see if the book, and chapter in the book, are in range
+    if not 0 < book <= len(bible):
+        return RangeError, "There is no book %s in the Bible" % book
+    book = bible[book - 1]
+    if not 0 < chapter <= len(book['verse_counts']):
+        return RangeError, "There are not that many chapters in " + book['name']
+    
+    # check to see if the verse is in range for the given chapter
+    if not 0 < verse <= book['verse_counts'][chapter - 1]:
+        return RangeError, "There is no verse %s in %s %s" % (verse, book['name'], chapter)
+    
+    # check to see if the specified verse is omitted
+    omissions = book.get('omissions')
+    if omissions and chapter <= len(omissions) and verse in omissions[chapter - 1]:
+        return RangeError, 'This verse is omitted from the %s translation.' % translation
+    
+    return None
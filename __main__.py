@@ -0,0 +1,114 @@
+# Command line tool to normalize Bible references, one per line, from files or
+# standard input - run python -m bible --help for the options
+
+import sys
+import argparse
+import collections
+import multiprocessing
+
+try:
+    from . import parse_many, InvalidReference
+except (ImportError, ValueError):
+    # run from inside the package directory, not as part of the package
+    from __init__ import parse_many, InvalidReference
+
+
+def _normalize_chunk(job):
+    """Normalize a chunk of lines - returns the text to write to standard
+    output, the text to write to standard error, and the number of invalid
+    references, so the parent process only has to write them out"""
+    
+    name, first, lines, template, blank = job
+    out = []
+    err = []
+    for item in parse_many(lines, errors='collect'):
+        if isinstance(item, InvalidReference):
+            err.append('%s:%s: %s: %r\n' % (name, first + item.index, item.message, item.value))
+            if blank:
+                out.append('\n')
+        elif template:
+            out.append(item.format(template) + '\n')
+        else:
+            out.append(str(item) + '\n')
+    return ''.join(out), ''.join(err), len(err)
+
+def _chunks(files, size, template, blank):
+    """Read lines from each file, yielding jobs for _normalize_chunk()"""
+    
+    for name in files:
+        if name == '-':
+            f = sys.stdin
+            label = '<stdin>'
+        else:
+            f = open(name)
+            label = name
+        try:
+            lines = []
+            first = 1
+            for line in f:
+                lines.append(line)
+                if len(lines) == size:
+                    yield label, first, lines, template, blank
+                    first += len(lines)
+                    lines = []
+            if lines:
+                yield label, first, lines, template, blank
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+def _imap(pool, jobs, window):
+    """Yield the results of _normalize_chunk() for each job in order, like
+    pool.imap(), but only read the next job once fewer than window chunks
+    are in flight - so big inputs aren't read into memory ahead of the
+    workers"""
+    
+    pending = collections.deque()
+    for job in jobs:
+        pending.append(pool.apply_async(_normalize_chunk, (job,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m bible',
+        description='Normalize Bible references, one per line.')
+    parser.add_argument('files', nargs='*', default=['-'],
+        help='files to read references from (default: standard input)')
+    parser.add_argument('-f', '--format', dest='template',
+        help='format string for the output, as for Verse.format() (default: b-c-v-t)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--chunk-size', type=int, default=5000,
+        help='number of lines sent to a worker at a time (default: 5000)')
+    parser.add_argument('--blank', action='store_true',
+        help='write a blank line for each invalid reference, so output lines match input lines')
+    args = parser.parse_args(argv)
+    
+    jobs = _chunks(args.files, max(args.chunk_size, 1), args.template, args.blank)
+    workers = args.jobs or multiprocessing.cpu_count()
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        results = _imap(pool, jobs, workers * 2)
+    else:
+        pool = None
+        results = (_normalize_chunk(job) for job in jobs)
+    
+    # the chunks are returned in order, so the output follows the input
+    invalid = 0
+    try:
+        for out, err, count in results:
+            if err:
+                sys.stderr.write(err)
+                invalid += count
+            sys.stdout.write(out)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    
+    return 1 if invalid else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
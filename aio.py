@@ -0,0 +1,255 @@
+# An asyncio front end for parsing and formatting references - requests made
+# at about the same time are parsed together in small batches, and identical
+# requests that are still in flight share one result
+
+import time
+import asyncio
+import functools
+
+try:
+    from . import (Verse, Passage, InvalidReference, format_many,
+                   _parse_and_check, _parse_normalized_passage)
+except (ImportError, ValueError):
+    # imported from inside the package directory, not as part of the package
+    from __init__ import (Verse, Passage, InvalidReference, format_many,
+                          _parse_and_check, _parse_normalized_passage)
+
+
+def _parse_batch(values):
+    """Parse and check a batch of values, returning (ref, err) for each as
+    _parse_and_check() does - for a normalized passage string, ref is a
+    pair of the start and end verses' values. At module level so it can run
+    in another process"""
+    
+    results = []
+    for value in values:
+        try:
+            value = value.strip()
+        except AttributeError:
+            pass
+        ref, err = _parse_and_check(value)
+        if err:
+            verses = _parse_normalized_passage(value)
+            if verses is not None:
+                ref = tuple((v.book, v.chapter, v.verse, v.translation) for v in verses)
+                err = None
+        results.append((ref, err))
+    return results
+
+def _reference(ref):
+    """Return the Verse or Passage for a ref from _parse_batch()"""
+    
+    if len(ref) == 2:
+        return Passage(Verse._from_parts(*ref[0]), Verse._from_parts(*ref[1]))
+    return Verse._from_parts(*ref)
+
+def _format_batch(items):
+    """Format a batch of (reference, format string) pairs, returning
+    (string, exception) for each"""
+    
+    results = []
+    for ref, val in items:
+        try:
+            results.append((ref.format(val) if val else ref.format(), None))
+        except Exception as err:
+            results.append((None, err))
+    return results
+
+
+class Resolver(object):
+    """Parses and formats references for coroutines, in micro-batches
+    
+    Each parse() or format() call waits (until the event loop has run the
+    other ready tasks, or for delay seconds if it is set, or until
+    batch_size requests are waiting) and is then handled along with
+    every other waiting request, so a busy server makes far fewer trips
+    through the batch code than it has requests. A request for the same
+    value as one that is already waiting shares its result.
+    
+    Batches of offload requests or more are run in executor (any
+    concurrent.futures executor, or None for the loop's default) when
+    use_executor is set, so big payloads don't stall the event loop:
+        
+        resolver = Resolver()
+        verse = await resolver.parse('Rom 8:28')
+        passage = await resolver.parse('45-8-28 45-8-39')
+        text = await resolver.format(verse, 'B C:V')"""
+    
+    def __init__(self, batch_size=256, delay=0, executor=None,
+                 use_executor=False, offload=2000):
+        self.batch_size = batch_size
+        self.delay = delay
+        self.executor = executor
+        self.use_executor = use_executor or executor is not None
+        self.offload = offload
+        
+        # counts for monitoring - requests, batches, and requests that
+        # shared the result of another request
+        self.requests = 0
+        self.batches = 0
+        self.coalesced = 0
+        
+        self._futures = {}
+        self._queues = {'parse': [], 'format': []}
+        self._timers = {}
+        self._tasks = set()
+    
+    async def parse(self, value):
+        """Return the Verse for any string Verse() accepts, or the Passage
+        for a normalized passage string (see Passage.__str__) - raises the
+        same exception Verse() would if it is not valid"""
+        
+        ref = await asyncio.shield(self._submit('parse', value))
+        return _reference(ref)
+    
+    async def format(self, reference, val=None):
+        """Return a formatted string for a Verse or Passage - with no format
+        string, passages get their _smart_format()"""
+        
+        return await asyncio.shield(self._submit('format', (reference, val)))
+    
+    async def parse_many(self, values, errors='raise'):
+        """Return a list of Verse (or Passage) objects for many values at
+        once, like bible.parse_many() and parse() - big lists are run in
+        the executor (see above), or parsed batch_size at a time, letting
+        other tasks run in between"""
+        
+        if errors not in ('raise', 'skip', 'collect'):
+            raise ValueError("errors must be 'raise', 'skip', or 'collect'")
+        
+        values = list(values)
+        verses = []
+        results = await self._run_batches(_parse_batch, values)
+        for i, (ref, err) in enumerate(results):
+            if not err:
+                verses.append(_reference(ref))
+            elif errors == 'raise':
+                raise err[0](err[1])
+            elif errors == 'collect':
+                verses.append(InvalidReference(i, values[i], err[1]))
+        return verses
+    
+    async def format_many(self, references, val=None):
+        """Return a list of formatted strings for many Verse and Passage
+        objects at once, like bible.format_many()"""
+        
+        return await self._run_batches(functools.partial(format_many, val=val), list(references))
+    
+    async def _run_batches(self, function, items):
+        """Call function on a list of items, in the executor if there are
+        enough of them, otherwise a batch at a time"""
+        
+        if self.use_executor and len(items) >= self.offload:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, function, items)
+        
+        results = []
+        for i in range(0, len(items), self.batch_size):
+            if i:
+                await asyncio.sleep(0)
+            results.extend(function(items[i:i + self.batch_size]))
+        return results
+    
+    def _submit(self, kind, key):
+        """Return the future for a request, adding it to the next batch if
+        the same request isn't already waiting"""
+        
+        self.requests += 1
+        future = self._futures.get((kind, key))
+        if future is not None:
+            self.coalesced += 1
+            return future
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._futures[kind, key] = future
+        queue = self._queues[kind]
+        queue.append(key)
+        if len(queue) >= self.batch_size:
+            self._flush(kind)
+        elif kind not in self._timers and self.delay:
+            self._timers[kind] = loop.call_later(self.delay, self._flush, kind)
+        elif kind not in self._timers:
+            self._timers[kind] = loop.call_soon(self._flush, kind)
+        return future
+    
+    def _flush(self, kind):
+        """Start a task to handle every waiting request of one kind"""
+        
+        timer = self._timers.pop(kind, None)
+        if timer is not None:
+            timer.cancel()
+        keys = self._queues[kind]
+        self._queues[kind] = []
+        if keys:
+            task = asyncio.ensure_future(self._run(kind, keys))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, kind, keys):
+        """Handle a batch of requests and set the result of their futures"""
+        
+        self.batches += 1
+        function = _parse_batch if kind == 'parse' else _format_batch
+        try:
+            if self.use_executor and len(keys) >= self.offload:
+                loop = asyncio.get_running_loop()
+                results = await loop.run_in_executor(self.executor, function, keys)
+            else:
+                results = function(keys)
+        except Exception as err:
+            results = [(None, err)] * len(keys)
+        
+        for key, (value, err) in zip(keys, results):
+            future = self._futures.pop((kind, key))
+            if future.done():
+                continue
+            if not err:
+                future.set_result(value)
+            elif isinstance(err, tuple):
+                future.set_exception(err[0](err[1]))
+            else:
+                future.set_exception(err)
+
+
+def load_test(inputs, concurrency=200, **options):
+    """Load test a Resolver - concurrency tasks each parse values from
+    inputs one after another until all of them have been parsed. Returns a
+    dict of the request rate and latency percentiles in microseconds, for
+    benchmark.py. Options are passed on to the Resolver"""
+    
+    timer = getattr(time, 'perf_counter', time.time)
+    resolver = Resolver(**options)
+    samples = []
+    
+    async def client(position):
+        while position[0] < len(inputs):
+            value = inputs[position[0]]
+            position[0] += 1
+            start = timer()
+            try:
+                await resolver.parse(value)
+            except Exception:
+                pass
+            samples.append(timer() - start)
+    
+    async def load():
+        position = [0]
+        await asyncio.gather(*[client(position) for i in range(concurrency)])
+    
+    start = timer()
+    asyncio.run(load())
+    elapsed = timer() - start
+    samples.sort()
+    percentile = lambda percent: samples[min(len(samples) - 1, int(len(samples) * percent / 100.0))]
+    return {
+        'requests': len(inputs),
+        'concurrency': concurrency,
+        'seconds': elapsed,
+        'requests_per_second': len(inputs) / elapsed,
+        'p50_us': percentile(50) * 1e6,
+        'p99_us': percentile(99) * 1e6,
+        'max_us': samples[-1] * 1e6,
+        'batches': resolver.batches,
+        'coalesced': resolver.coalesced,
+    }
@@ -0,0 +1,152 @@
+# NumPy versions of the verse and passage calculations, for working with whole
+# columns of references at once - verses are arrays of ordinals (see Verse.ordinal)
+
+import numpy as np
+
+try:
+    from . import data
+except (ImportError, ValueError):
+    # imported from inside the package directory, not as part of the package
+    import data
+
+
+# numpy copies of the canon tables for each translation - see _tables()
+_canon_tables = {}
+
+def _tables(translation=None):
+    """Return a dict of numpy arrays describing the canon for a translation"""
+    
+    translation = data._key(translation)
+    try:
+        return _canon_tables[translation]
+    except KeyError:
+        pass
+    
+    bible = data.canon(translation)
+    chapter_ordinals, starts, chapters, total = data.ordinal_tables(translation)
+    tables = {
+        # index of the first chapter of each book in the chapter arrays
+        'first_chapter': np.cumsum([0] + [len(b['verse_counts']) for b in bible]),
+        'chapter_counts': np.array([len(b['verse_counts']) for b in bible]),
+        # ordinal of the first verse, verse count, book and chapter number of each chapter
+        'chapter_starts': np.array(starts),
+        'verse_counts': np.array([n for b in bible for n in b['verse_counts']]),
+        'chapter_books': np.array([c[0] for c in chapters]),
+        'chapter_numbers': np.array([c[1] for c in chapters]),
+        'omitted': np.array(data.omitted_ordinals(translation), dtype=np.int64),
+        'total': total,
+    }
+    return _canon_tables.setdefault(translation, tables)
+
+data.add_reset_hook(_canon_tables.clear)
+
+def valid(books, chapters, verses, translation=None):
+    """Return a boolean array that is True where (book, chapter, verse) is a
+    verse that exists in the translation (in range, and not omitted)"""
+    
+    books, chapters, verses = np.broadcast_arrays(
+        np.asarray(books), np.asarray(chapters), np.asarray(verses))
+    t = _tables(translation)
+    
+    # check the book and chapter, then look up the chapter's verse count
+    ok = (books >= 1) & (books <= len(t['chapter_counts']))
+    b = np.where(ok, books, 1) - 1
+    ok &= (chapters >= 1) & (chapters <= t['chapter_counts'][b])
+    index = np.where(ok, t['first_chapter'][b] + chapters - 1, 0)
+    ok &= (verses >= 1) & (verses <= t['verse_counts'][index])
+    
+    # leave out omitted verses
+    ordinals = t['chapter_starts'][index] + verses - 1
+    return ok & ~np.isin(ordinals, t['omitted'])
+
+def to_ordinals(books, chapters, verses, translation=None):
+    """Return an array of ordinals for arrays of books, chapters and verses
+    Raises ValueError if any of the verses do not exist"""
+    
+    books, chapters, verses = np.broadcast_arrays(
+        np.asarray(books), np.asarray(chapters), np.asarray(verses))
+    if not valid(books, chapters, verses, translation).all():
+        raise ValueError('Not every verse exists in the %s translation' % translation)
+    t = _tables(translation)
+    return t['chapter_starts'][t['first_chapter'][books - 1] + chapters - 1] + verses - 1
+
+def from_ordinals(ordinals, translation=None):
+    """Return (books, chapters, verses) arrays for an array of ordinals"""
+    
+    ordinals = np.asarray(ordinals)
+    t = _tables(translation)
+    if ((ordinals < 0) | (ordinals >= t['total'])).any():
+        raise ValueError('Ordinals must be between 0 and %s' % (t['total'] - 1))
+    index = np.searchsorted(t['chapter_starts'], ordinals, side='right') - 1
+    return (t['chapter_books'][index], t['chapter_numbers'][index],
+            ordinals - t['chapter_starts'][index] + 1)
+
+def parse_normalized(strings):
+    """Split normalized b-c-v(-t) strings (see Verse.__str__) into arrays
+    Returns (books, chapters, verses, translations) - translations is an
+    array of strings, empty where there is no translation"""
+    
+    strings = np.asarray(strings, dtype=str)
+    parts = np.char.partition(strings, '-')
+    books = parts[..., 0].astype(int)
+    parts = np.char.partition(parts[..., 2], '-')
+    chapters = parts[..., 0].astype(int)
+    parts = np.char.partition(parts[..., 2], '-')
+    return books, chapters, parts[..., 0].astype(int), parts[..., 2]
+
+def normalized_to_ordinals(strings):
+    """Return (ordinals, translations) for normalized b-c-v(-t) strings,
+    checking each verse against its own translation"""
+    
+    books, chapters, verses, translations = parse_normalized(strings)
+    ordinals = np.empty(books.shape, dtype=np.int64)
+    for translation in np.unique(translations):
+        rows = translations == translation
+        ordinals[rows] = to_ordinals(
+            books[rows], chapters[rows], verses[rows], str(translation) or None)
+    return ordinals, translations
+
+def to_normalized(ordinals, translation=None):
+    """Return an array of normalized b-c-v(-t) strings for ordinals"""
+    
+    books, chapters, verses = from_ordinals(ordinals, translation)
+    strings = np.char.add(np.char.add(np.char.add(
+        books.astype(str), '-'), np.char.add(chapters.astype(str), '-')), verses.astype(str))
+    if translation:
+        strings = np.char.add(strings, '-' + translation)
+    return strings
+
+def map_ordinals(ordinals, source, target):
+    """Return an array of the ordinals in the target translation of the
+    verses with ordinals in the source translation - -1 where the target
+    omits the verse (see data.mapping_table)"""
+    
+    ordinals = np.asarray(ordinals)
+    table = np.frombuffer(data.mapping_table(source, target), dtype=np.intc)
+    if ((ordinals < 0) | (ordinals >= len(table))).any():
+        raise ValueError('Ordinals must be between 0 and %s' % (len(table) - 1))
+    return table[ordinals]
+
+def omitted(ordinals, translation=None):
+    """Return a boolean array that is True for verses omitted from the translation"""
+    return np.isin(ordinals, _tables(translation)['omitted'])
+
+def contains(starts, ends, ordinals, translation=None):
+    """Return a boolean array that is True where each verse is included in
+    the passage from the matching start to end (like Passage.__contains__)"""
+    
+    ordinals = np.asarray(ordinals)
+    return (np.asarray(starts) <= ordinals) & (ordinals <= np.asarray(ends)) & ~omitted(ordinals, translation)
+
+def lengths(starts, ends, translation=None):
+    """Return an array with the number of verses in each passage from the
+    matching start to end (like Passage.__len__)"""
+    
+    omitted_ordinals = _tables(translation)['omitted']
+    starts = np.asarray(starts)
+    ends = np.asarray(ends) + 1
+    
+    # the rank of an ordinal is the number of non-omitted verses before it
+    count = ((ends - np.searchsorted(omitted_ordinals, ends)) -
+             (starts - np.searchsorted(omitted_ordinals, starts)))
+    return np.maximum(count, 0)
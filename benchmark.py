@@ -0,0 +1,354 @@
+import io
+import gc
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import subprocess
+
+try:
+    from . import data, codec, extract
+    from . import Verse, Passage, RangeError, _format_char
+except (ImportError, ValueError):
+    # imported from inside the package directory, not as part of the package
+    import data
+    import codec
+    import extract
+    from __init__ import Verse, Passage, RangeError, _format_char
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# the most precise timer available
+_timer = getattr(time, 'perf_counter', time.time)
+
+# filler words for the synthetic documents, and references to scatter in them
+_words = ('the', 'and', 'of', 'grace', 'faith', 'in', 'him', 'we', 'see', 'as',
+          'was', 'said', 'Jesus', 'Paul', 'Lord', 'chapter', 'verse', '1', '12')
+_references = ('Rom. 8:28', 'John 3:16', '1 Cor 13:4-7', 'Gen 1:1 - 2:3',
+               'Ps 23:1', 'jude 1:3', 'Matt 5:3-12', 'Rev 22:21', '2 Tim 3:16')
+
+# every translation with special data, and no translation
+translations = (None, 'ESV', 'RSV', 'NIV', 'NASB', 'NRSV', 'NCV', 'LB', 'KJV')
+
+
+def sample_document(size, seed=0, density=0.02):
+    """Return a synthetic (unicode) document of about size characters, with
+    a reference in place of roughly density of its words"""
+    
+    rand = random.Random(seed)
+    words = []
+    length = 0
+    while length < size:
+        if rand.random() < density:
+            word = rand.choice(_references)
+        else:
+            word = rand.choice(_words)
+        words.append(word)
+        length += len(word) + 1
+    return u' '.join(words)
+
+def sample_verses(count, seed=0):
+    """Return count random verses that exist in their (random) translation"""
+    
+    rand = random.Random(seed)
+    verses = []
+    while len(verses) < count:
+        translation = rand.choice(translations)
+        ordinal = rand.randrange(data.ordinal_tables()[3])
+        if ordinal not in data.omitted_ordinals(translation):
+            verses.append(Verse.from_ordinal(ordinal, translation))
+    return verses
+
+def sample_normalized(count, seed=0):
+    """Return count normalized b-c-v(-t) strings"""
+    return [str(v) for v in sample_verses(count, seed)]
+
+def sample_free_text(count, seed=0, invalid=0.1):
+    """Return count messy, hand typed references - with different cases,
+    abbreviations, spacing, and translations - about invalid of them bad"""
+    
+    rand = random.Random(seed)
+    bible = data.canon()
+    strings = []
+    for verse in sample_verses(count, seed):
+        book = bible[verse.book - 1]
+        name = rand.choice((book['name'],) + book['abbrs'])
+        name = rand.choice((name, name.upper(), name.title(), name + '.'))
+        s = '%s%s%s:%s' % (name, rand.choice(('', ' ', '  ')), verse.chapter, verse.verse)
+        if verse.translation:
+            s += ' ' + rand.choice((verse.translation, verse.translation.lower()))
+        if rand.random() < invalid:
+            s = rand.choice(('%s 1' % name, 'Nope %s:%s' % (verse.chapter, verse.verse),
+                             '%s %s:%s' % (name, verse.chapter, verse.verse + 200)))
+        strings.append(s)
+    return strings
+
+def sample_passages(count, seed=0):
+    """Return count passages, most of them crossing books"""
+    
+    rand = random.Random(seed)
+    verses = sample_verses(count * 2, seed)
+    passages = []
+    for i in range(count):
+        start = verses[i * 2]
+        end = Verse.from_ordinal(rand.randint(start.ordinal, data.ordinal_tables()[3] - 1))
+        if end.ordinal in data.omitted_ordinals(start.translation):
+            end = start
+        passages.append(Passage(start, Verse(end.book, end.chapter, end.verse, start.translation)))
+    return passages
+
+def sample_omissions():
+    """Return (book, chapter, verse, translation) for every omitted verse in
+    every translation, and the verses either side of it"""
+    
+    refs = []
+    for translation in translations:
+        for ordinal in data.omitted_ordinals(translation):
+            for o in (ordinal - 1, ordinal, ordinal + 1):
+                refs.append(data.reference(o, translation) + (translation,))
+    return refs
+
+def _new_verse(args):
+    try:
+        return Verse(*args)
+    except RangeError:
+        return None
+
+def _format_chars(verse):
+    return ''.join([_format_char(verse, c) for c in 'B C:V'])
+
+def benchmarks(size):
+    """Return a list of (name, function, inputs) for each benchmark"""
+    
+    passages = sample_passages(size)
+    verses = sample_verses(size, seed=1)
+    return [
+        ('parse_normalized', Verse, sample_normalized(size)),
+        ('parse_free_text', Verse.try_parse, sample_free_text(size)),
+        ('from_normalized', Verse.from_normalized, sample_normalized(size)),
+        ('validate_omissions', _new_verse, sample_omissions()),
+        ('verse_format', Verse.format, verses),
+        ('format_char', _format_chars, verses),
+        ('passage_smart_format', Passage.format, passages),
+        ('passage_len', len, passages),
+        ('passage_contains', lambda pair: pair[0] in pair[1], list(zip(verses, passages))),
+        ('passage_from_normalized', Passage.from_normalized, [str(p) for p in passages]),
+        ('passage_decode', codec.decode, [codec.encode(p) for p in passages]),
+        ('passage_iter', lambda p: sum(1 for v in p), passages[:max(size // 100, 1)]),
+        ('verse_offset', lambda v: v.offset(-5 if v.ordinal > 100 else 5), verses),
+    ]
+
+def _percentile(samples, percent):
+    """Return a percentile of a sorted list of samples"""
+    return samples[min(len(samples) - 1, int(len(samples) * percent / 100.0))]
+
+def measure(name, function, inputs, repeat=3):
+    """Run a function over every input, returning a dict of the results -
+    the best total time of repeat runs, per operation latency percentiles
+    in microseconds, and (on Python 3) the memory allocated"""
+    
+    # the total time for all of the inputs
+    best = None
+    for i in range(repeat):
+        start = _timer()
+        for item in inputs:
+            function(item)
+        elapsed = _timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    
+    # the time of each operation on its own
+    timer = _timer
+    samples = []
+    for item in inputs:
+        start = timer()
+        function(item)
+        samples.append(timer() - start)
+    samples.sort()
+    
+    result = {
+        'name': name,
+        'operations': len(inputs),
+        'seconds': best,
+        'operations_per_second': len(inputs) / best if best else None,
+        'p50_us': _percentile(samples, 50) * 1e6,
+        'p90_us': _percentile(samples, 90) * 1e6,
+        'p99_us': _percentile(samples, 99) * 1e6,
+        'max_us': samples[-1] * 1e6,
+        'peak_bytes': None,
+        'retained_bytes': None,
+    }
+    
+    # measure the memory allocated while running the inputs - the most in
+    # use at once, and how much was still in use at the end
+    if tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        for item in inputs:
+            function(item)
+        result['retained_bytes'], result['peak_bytes'] = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    
+    return result
+
+def extract_throughput(size=4 * 1024 * 1024, repeat=3, chunk_size=65536):
+    """Time extract.extract_stream() over a synthetic document and return
+    the best run as a dict of characters and references per second"""
+    
+    text = sample_document(size)
+    best = None
+    for i in range(repeat):
+        start = _timer()
+        count = 0
+        for match in extract.extract_stream(io.StringIO(text), chunk_size=chunk_size):
+            count += 1
+        elapsed = _timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return {
+        'name': 'extract_stream',
+        'characters': len(text),
+        'references': count,
+        'seconds': best,
+        'mb_per_second': len(text) / best / (1024 * 1024),
+        'references_per_second': count / best,
+    }
+
+def resolver_latency(requests=20000, concurrency=200, seed=0, **options):
+    """Load test aio.Resolver (on Python 3.7 or later) - concurrency tasks
+    each parse references one after another (drawn from a small pool, so
+    some are requested at the same time) until requests have been made.
+    Returns a dict of the request rate and latency percentiles in
+    microseconds. Options are passed on to the Resolver"""
+    
+    # aio uses async syntax, so only import it when it is needed
+    try:
+        from . import aio
+    except (ImportError, ValueError):
+        import aio
+    
+    rand = random.Random(seed)
+    pool = sample_free_text(max(requests // 4, 1), seed)
+    inputs = [rand.choice(pool) for i in range(requests)]
+    result = aio.load_test(inputs, concurrency, **options)
+    result['name'] = 'resolver'
+    return result
+
+def import_time(repeat=5, package=None):
+    """Time importing the bible package in new Python processes, using
+    python -X importtime where it is available. Returns the best run as a
+    dict with the time in milliseconds and the modules the import loaded"""
+    
+    package = package or __package__ or 'bible'
+    code = ('import sys; before = set(sys.modules); import %s; '
+            'print(" ".join(sorted(set(sys.modules) - before)))' % package)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    importtime = sys.version_info >= (3, 7)
+    
+    best = None
+    for i in range(repeat):
+        start = _timer()
+        command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+        process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, universal_newlines=True)
+        out, err = process.communicate()
+        elapsed = (_timer() - start) * 1000
+        
+        # the cumulative time on the importtime line for the package itself
+        if importtime:
+            for line in err.splitlines():
+                parts = line.split('|')
+                if len(parts) == 3 and parts[2].strip() == package:
+                    elapsed = int(parts[1]) / 1000.0
+        if best is None or elapsed < best:
+            best = elapsed
+            modules = out.split()
+    
+    return {
+        'name': 'import',
+        'milliseconds': best,
+        'importtime': importtime,
+        'modules': modules,
+    }
+
+def run(size=10000, repeat=3, only=None, extract_size=4 * 1024 * 1024, concurrency=200):
+    """Run the benchmarks (or the ones named in only) and return a dict of
+    the environment and results that can be saved as JSON"""
+    
+    results = []
+    for name, function, inputs in benchmarks(size):
+        if not only or name in only:
+            results.append(measure(name, function, inputs, repeat))
+    if not only or 'extract_stream' in only:
+        results.append(extract_throughput(extract_size, repeat))
+    if not only or 'import' in only:
+        results.append(import_time())
+    if (not only or 'resolver' in only) and sys.version_info >= (3, 7):
+        results.append(resolver_latency(size * 2, concurrency))
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'size': size,
+        'repeat': repeat,
+        'results': results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m bible.benchmark',
+        description='Benchmark parsing, validation, formatting and passage math.')
+    parser.add_argument('--size', type=int, default=10000,
+        help='number of inputs in each synthetic corpus (default: 10000)')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='number of timed runs - the best is reported (default: 3)')
+    parser.add_argument('--only', action='append',
+        help='only run the named benchmark (may be repeated)')
+    parser.add_argument('--json', dest='json_file',
+        help='also write the results to this file as JSON ("-" for standard output)')
+    parser.add_argument('--concurrency', type=int, default=200,
+        help='number of concurrent clients in the resolver load test (default: 200)')
+    parser.add_argument('--max-import-ms', type=float,
+        help='exit with an error if importing the package takes longer than this')
+    args = parser.parse_args(argv)
+    
+    report = run(args.size, args.repeat, args.only, concurrency=args.concurrency)
+    status = _check_import(report, args.max_import_ms)
+    if args.json_file == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+        return status
+    
+    for r in report['results']:
+        if r['name'] == 'import':
+            print('%-22s %10.2f ms   %s modules' % (r['name'], r['milliseconds'], len(r['modules'])))
+        elif r['name'] == 'resolver':
+            print('%-22s %10.0f req/s  p50 %7.2fus  p99 %7.2fus  %s batches, %s coalesced' % (
+                r['name'], r['requests_per_second'], r['p50_us'], r['p99_us'], r['batches'], r['coalesced']))
+        elif 'mb_per_second' in r:
+            print('%-22s %10.2f MB/s %12.0f refs/s' % (r['name'], r['mb_per_second'], r['references_per_second']))
+        else:
+            print('%-22s %10.0f ops/s  p50 %7.2fus  p99 %7.2fus  peak %s bytes' % (
+                r['name'], r['operations_per_second'], r['p50_us'], r['p99_us'], r['peak_bytes']))
+    if args.json_file:
+        with open(args.json_file, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return status
+
+def _check_import(report, max_ms):
+    """Return 1 (and complain) if the import took longer than max_ms"""
+    
+    for r in report['results']:
+        if max_ms is not None and r['name'] == 'import' and r['milliseconds'] > max_ms:
+            sys.stderr.write('Importing took %.2f ms - more than %.2f ms\n' % (r['milliseconds'], max_ms))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
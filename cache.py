@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """A small, bounded cache that throws away the least recently used
+    entries once it holds maxsize of them - keeps count of hits and misses"""
+    
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+    
+    def get(self, key, default=None):
+        """Return the cached value for key (marking it as recently used), or
+        default if it is not in the cache"""
+        
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data[key] = value
+        self.hits += 1
+        return value
+    
+    def put(self, key, value):
+        """Add a value to the cache and return it"""
+        
+        if self.maxsize <= 0:
+            return value
+        self._data.pop(key, None)
+        self._data[key] = value
+        
+        # throw away the oldest entries if we have too many
+        while len(self._data) > self.maxsize:
+            try:
+                self._data.popitem(last=False)
+            except KeyError:
+                break
+        return value
+    
+    def clear(self):
+        """Empty the cache and reset the hit and miss counts"""
+        
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self):
+        return len(self._data)
+    
+    def __contains__(self, key):
+        return key in self._data
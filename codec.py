@@ -0,0 +1,85 @@
+# Compact binary encoding for passages - each passage is a fixed-width record
+# of its start and end ordinals (see Verse.ordinal) and a translation id
+
+import struct
+
+try:
+    from . import Verse, Passage, RangeError
+except (ImportError, ValueError):
+    # imported from inside the package directory, not as part of the package
+    from __init__ import Verse, Passage, RangeError
+
+# start ordinal, end ordinal (unsigned shorts), and translation id (a byte)
+_record = struct.Struct('<HHB')
+
+# the number of bytes in each encoded passage
+record_size = _record.size
+
+# the translation for each id - the position in the list is the id that is
+# stored, so only ever add translations to the end of the list
+translations = [None, 'ESV', 'RSV', 'NIV', 'NASB', 'NRSV', 'NCV', 'LB', 'KJV']
+
+def _translation_id(translation):
+    try:
+        return translations.index(translation)
+    except ValueError:
+        raise ValueError('The %s translation has no id - add it to codec.translations' % translation)
+
+def encode(passage):
+    """Return the record_size bytes representing a Passage (or a Verse, as
+    a passage of one verse)"""
+    
+    start = getattr(passage, 'start', passage)
+    end = getattr(passage, 'end', passage)
+    return _record.pack(start.ordinal, end.ordinal, _translation_id(start.translation))
+
+def decode(buffer, offset=0):
+    """Return the Passage encoded at offset in bytes, a bytearray, or a
+    memoryview. Raises RangeError if the verses do not exist"""
+    
+    return _passage(*_record.unpack_from(buffer, offset))
+
+def encode_many(passages):
+    """Return the records for many passages joined into one bytes object"""
+    
+    pack = _record.pack
+    ids = {}
+    records = []
+    for passage in passages:
+        start = getattr(passage, 'start', passage)
+        end = getattr(passage, 'end', passage)
+        translation = start.translation
+        if translation not in ids:
+            ids[translation] = _translation_id(translation)
+        records.append(pack(start.ordinal, end.ordinal, ids[translation]))
+    return b''.join(records)
+
+def decode_many(buffer):
+    """Iterate over the passages in bytes, a bytearray, or a memoryview
+    holding records from encode_many()"""
+    
+    if len(buffer) % record_size:
+        raise ValueError('The buffer is not a whole number of %s byte records' % record_size)
+    unpack = _record.unpack_from
+    for offset in range(0, len(buffer), record_size):
+        yield _passage(*unpack(buffer, offset))
+
+def _passage(start, end, translation_id):
+    """Return a Passage for the ordinals and translation id of a record"""
+    
+    try:
+        translation = translations[translation_id]
+    except IndexError:
+        raise RangeError('There is no translation with the id %s' % translation_id)
+    
+    # a record that holds one verse only needs one Verse
+    start = Verse.from_ordinal(start, translation)
+    if end == start.ordinal:
+        end = start
+    else:
+        end = Verse.from_ordinal(end, translation)
+    
+    p = Passage.__new__(Passage)
+    p.start = start
+    p.end = end
+    return p
@@ -1,3 +1,8 @@
+import os
+import sys
+import array
+import bisect
+
 def bible_data(translation=None):
     """Return an array with reference data for each book of the bible - based on a specific translation"""
     
@@ -395,39 +400,16 @@ def bible_data(translation=None):
         }
     ]
     
+    # use the books registered for the translation, if it has its own
+    settings = _translations.get(translation)
+    if settings and settings['books']:
+        bible = [dict(book, abbrs=list(book['abbrs']), verse_counts=list(book['verse_counts']))
+                 for book in settings['books']]
+    
     # add omissions by version
-    if translation:
-        if translation in ('RSV', 'ESV'):
-            bible = add_omission(bible, 40, 12, 47)      # Matt 12:47
-            bible = add_omission(bible, 42, 24, 40)      # Luke 24:40
-            bible = add_omission(bible, 43, 7, 53)       # John 7:53
-            #bible = add_omission(bible, 43, 8, 1, 11)    # John 8:1-11 -- Need to double check this - may just be foot note
-        if translation in ('RSV'):
-            bible = add_omission(bible, 40, 21, 44)      # Matt 21:44
-            bible = add_omission(bible, 42, 22, 43, 44)  # Luke 22:43-44
-            bible = add_omission(bible, 42, 24, 12)      # Luke 24:12
-            bible = add_omission(bible, 47, 13, 14)      # 2 Cor 13:14
-            bible = add_omission(bible, 59, 1, 8)        # Jam 1:8
-        if translation in ('NIV', 'NASB', 'RSV', 'NRSV', 'NCV', 'ESV'):
-            bible = add_omission(bible, 40, 17, 21)      # Matt 17:21
-            bible = add_omission(bible, 40, 18, 11)      # Matt 18:11
-            bible = add_omission(bible, 40, 23, 14)      # Matt 23:14
-            bible = add_omission(bible, 41, 15, 28)      # Mark 15:28
-            bible = add_omission(bible, 42, 17, 36)      # Luke 17:36
-            bible = add_omission(bible, 43, 5, 4)        # John 5:4
-            bible = add_omission(bible, 44, 8, 37)       # Acts 8:37
-            bible = add_omission(bible, 45, 16, 24)      # Rom 16:24
-            bible = add_omission(bible, 44, 24, 7)       # Acts 24:7
-        if translation in ('NIV', 'NASB', 'RSV', 'NRSV', 'NCV', 'ESV', 'LB'):
-            bible = add_omission(bible, 41, 7, 16)       # Mark 7:16
-            bible = add_omission(bible, 41, 9, 44)       # Mark 9:44
-            bible = add_omission(bible, 41, 9, 46)       # Mark 9:46
-            bible = add_omission(bible, 41, 11, 26)      # Mark 11:26
-            bible = add_omission(bible, 42, 23, 17)      # Luke 23:17
-            bible = add_omission(bible, 44, 15, 34)      # Acts 15:34
-            bible = add_omission(bible, 44, 28, 29)      # Acts 28:29
-        if translation in ('KJV', 'NIV'): # Also not in the ASV, and some others.
-            bible = add_omission(bible, 64, 1, 15)       # 3 John 15
+    if settings:
+        for omission in settings['omissions']:
+            bible = add_omission(bible, *omission)
     
     # send back the bible list var
     return bible
@@ -456,4 +438,518 @@ def add_omission(bible, book, chapter, verse, endverse=None):
         for v in range(verse, endverse + 1):
             omissions[chapter-1].append(v)
     
-    return bible
\ No newline at end of file
+    return bible
+
+
+# verses omitted from the translations with special data, by the group of
+# translations that omit them
+_builtin_omissions = (
+    (('RSV', 'ESV'), (
+        (40, 12, 47),       # Matt 12:47
+        (42, 24, 40),       # Luke 24:40
+        (43, 7, 53),        # John 7:53
+        #(43, 8, 1, 11),    # John 8:1-11 -- Need to double check this - may just be foot note
+    )),
+    (('RSV',), (
+        (40, 21, 44),       # Matt 21:44
+        (42, 22, 43, 44),   # Luke 22:43-44
+        (42, 24, 12),       # Luke 24:12
+        (47, 13, 14),       # 2 Cor 13:14
+        (59, 1, 8),         # Jam 1:8
+    )),
+    (('NIV', 'NASB', 'RSV', 'NRSV', 'NCV', 'ESV'), (
+        (40, 17, 21),       # Matt 17:21
+        (40, 18, 11),       # Matt 18:11
+        (40, 23, 14),       # Matt 23:14
+        (41, 15, 28),       # Mark 15:28
+        (42, 17, 36),       # Luke 17:36
+        (43, 5, 4),         # John 5:4
+        (44, 8, 37),        # Acts 8:37
+        (45, 16, 24),       # Rom 16:24
+        (44, 24, 7),        # Acts 24:7
+    )),
+    (('NIV', 'NASB', 'RSV', 'NRSV', 'NCV', 'ESV', 'LB'), (
+        (41, 7, 16),        # Mark 7:16
+        (41, 9, 44),        # Mark 9:44
+        (41, 9, 46),        # Mark 9:46
+        (41, 11, 26),       # Mark 11:26
+        (42, 23, 17),       # Luke 23:17
+        (44, 15, 34),       # Acts 15:34
+        (44, 28, 29),       # Acts 28:29
+    )),
+    (('KJV', 'NIV'), (      # Also not in the ASV, and some others.
+        (64, 1, 15),        # 3 John 15
+    )),
+)
+
+# the translations with special data - see register_translation()
+_translations = {}
+
+# functions to call when translation data changes, so cached data built
+# from it can be thrown away - see add_reset_hook()
+_reset_hooks = []
+
+def register_translation(name, omissions=(), books=None, base=None):
+    """Register a translation (or replace one that is already registered)
+    
+    omissions - (book, chapter, verse) or (book, chapter, verse, endverse)
+                for each verse or range of verses omitted from the translation
+    books     - a list of dicts like the ones from bible_data(), with 'name',
+                'abbrs', 'testament', and 'verse_counts' for each book - use
+                this for a different versification (by default, the same
+                books as every other translation)
+    base      - the name of a registered translation to start from - its
+                books and omissions are used as well as the ones given (if
+                books are given too, its omissions are moved to the books
+                with the same names, and dropped for books that are missing)
+    
+    Raises ValueError if an omission is not a verse in the books"""
+    
+    omissions = [tuple(o) for o in omissions]
+    for o in omissions:
+        if len(o) not in (3, 4):
+            raise ValueError('Omissions must be (book, chapter, verse[, endverse]): %r' % (o,))
+    if books is not None:
+        books = [dict(book) for book in books]
+        for book in books:
+            for key in ('name', 'abbrs', 'verse_counts'):
+                if key not in book:
+                    raise ValueError('Every book needs a %r: %r' % (key, book))
+            book['abbrs'] = [abbr.lower() for abbr in book['abbrs']]
+            book.setdefault('testament', None)
+    
+    # start with the base translation's data
+    if base is not None:
+        if base not in _translations:
+            raise ValueError('There is no registered translation %r' % base)
+        base_omissions = _translations[base]['omissions']
+        if books is None:
+            books = _translations[base]['books']
+        else:
+            base_books = _translations[base]['books'] or bible_data(None)
+            base_omissions = _renumber_omissions(base_omissions, base_books, books)
+        omissions = base_omissions + omissions
+    
+    _check_omissions(omissions, books or bible_data(None))
+    _translations[name] = {'books': books, 'omissions': omissions}
+    _reset()
+
+def _renumber_omissions(omissions, old_books, new_books):
+    """Return omissions for old_books with the numbers of the books of the
+    same name in new_books, leaving out books that new_books doesn't have"""
+    
+    numbers = dict((book['name'].lower(), b + 1) for b, book in enumerate(new_books))
+    renumbered = []
+    for o in omissions:
+        book = numbers.get(old_books[o[0] - 1]['name'].lower())
+        if book is not None:
+            renumbered.append((book,) + tuple(o[1:]))
+    return renumbered
+
+def _check_omissions(omissions, books):
+    """Raise ValueError if any of the omissions is not a verse in the books"""
+    
+    for o in omissions:
+        book, chapter, verse = o[:3]
+        endverse = o[3] if len(o) == 4 and o[3] else verse
+        counts = books[book - 1]['verse_counts'] if 1 <= book <= len(books) else ()
+        if not (1 <= chapter <= len(counts) and 1 <= verse <= endverse <= counts[chapter - 1]):
+            raise ValueError('Omission %r is not a verse in the translation' % (o,))
+
+def translations():
+    """Return a sorted list of the names of translations with special data"""
+    return sorted(_translations)
+
+def load_translations(path, cache=True):
+    """Register the translations described in a JSON data file, returning
+    a list of their names. The file holds one object (or a list of them)
+    with the arguments for register_translation():
+    
+        [{"name": "NABRE", "omissions": [[40, 17, 21], [41, 9, 44, 46]]},
+         {"name": "GEN", "omissions": [[1, 2, 25]],
+          "books": [{"name": "Genesis", "abbrs": ["gen"], "verse_counts": [31, 25]}]}]
+    
+    Unless cache is False, the parsed file is also saved in a compiled
+    (marshal) cache file next to it, which is used while the data file has
+    the same size and modification time - loading the cache is much faster
+    than parsing the file"""
+    
+    entries = _read_data_file(path, cache)
+    if isinstance(entries, dict):
+        entries = [entries]
+    names = []
+    for entry in entries:
+        register_translation(entry['name'], entry.get('omissions', ()),
+                             entry.get('books'), entry.get('base'))
+        names.append(entry['name'])
+    return names
+
+def _read_data_file(path, cache):
+    """Return the parsed contents of a JSON data file, using (and updating)
+    its compiled cache file if cache is True"""
+    
+    # only imported when needed, to keep importing bible fast
+    import json
+    import marshal
+    
+    # marshal data can only be read by the same version of Python
+    cache_path = '%s.py%s%s.cache' % ((path,) + tuple(sys.version_info[:2]))
+    if cache:
+        # the cache starts with the size and modification time of the file
+        # it was made from, and is only used if the file still has both -
+        # a file copied over with its old time kept is still read again
+        try:
+            source = os.stat(path)
+            stamp = (source.st_size, source.st_mtime)
+            with open(cache_path, 'rb') as f:
+                if marshal.load(f) == stamp:
+                    return marshal.load(f)
+        except (OSError, IOError, EOFError, ValueError, TypeError):
+            pass
+    
+    with open(path) as f:
+        contents = json.load(f)
+    
+    # write the cache, but don't fail if we can't (e.g. a read-only directory)
+    if cache:
+        try:
+            with open(cache_path + '.tmp', 'wb') as f:
+                marshal.dump(stamp, f)
+                marshal.dump(contents, f)
+            os.rename(cache_path + '.tmp', cache_path)
+        except (OSError, IOError, ValueError):
+            pass
+    return contents
+
+def add_reset_hook(function):
+    """Call function (with no arguments) whenever translation data changes,
+    so anything cached from it can be thrown away"""
+    
+    _reset_hooks.append(function)
+
+def _key(translation):
+    """Return the cache key for a translation - unregistered translations
+    (which could be any word typed after a reference) use the default data,
+    so they can't fill the caches"""
+    
+    return translation if translation in _translations else None
+
+def _books_key(translation):
+    """Return the cache key for data that only depends on a translation's
+    books - translations with the usual books share the default data"""
+    
+    settings = _translations.get(translation)
+    return translation if settings and settings['books'] else None
+
+def _reset():
+    """Throw away all of the data built from the translations"""
+    
+    _canons.clear()
+    _ordinal_tables.clear()
+    _omitted_ordinals.clear()
+    _book_indexes.clear()
+    _mapping_tables.clear()
+    for function in _reset_hooks:
+        function()
+
+# register the translations with special data
+for _names, _omissions in _builtin_omissions:
+    for _name in _names:
+        _translations.setdefault(_name, {'books': None, 'omissions': []})
+        _translations[_name]['omissions'].extend(_omissions)
+del _names, _omissions, _name
+
+class ReadOnlyDict(dict):
+    """A dict that refuses to be modified - used for the shared canon data"""
+    
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('Canon data is shared and can not be modified')
+    
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = __ior__ = _read_only
+
+
+# shared, read-only canon data for each translation - see canon()
+_canons = {}
+
+def canon(translation=None):
+    """Return the shared, read-only reference data for a translation
+    
+    The data is built from bible_data() the first time a translation is
+    requested and reused by every caller after that. Books are read-only
+    dicts and all lists are converted to tuples, so the data can not be
+    changed by accident. Use bible_data() if you need a copy to modify."""
+    
+    # return the cached data if we have already built it
+    translation = _key(translation)
+    try:
+        return _canons[translation]
+    except KeyError:
+        pass
+    
+    bible = []
+    for book in bible_data(translation):
+        book = dict(book)
+        book['verse_counts'] = tuple(book['verse_counts'])
+        book['abbrs'] = tuple(book['abbrs'])
+        if 'omissions' in book:
+            book['omissions'] = tuple(tuple(o or ()) for o in book['omissions'])
+        bible.append(ReadOnlyDict(book))
+    bible = tuple(bible)
+    
+    # translations without omissions share the default data
+    if translation is not None and bible == canon(None):
+        bible = canon(None)
+    
+    return _canons.setdefault(translation, bible)
+
+
+# lookup index of lowercase book names and abbreviations, and a sorted list
+# of its keys for prefix searches, by translation - see find_book()
+_book_indexes = {}
+
+def _book_index(translation=None):
+    """Return the (index, sorted keys) to look up books in a translation"""
+    
+    # translations with the usual books share the default index
+    translation = _books_key(translation)
+    try:
+        return _book_indexes[translation]
+    except KeyError:
+        pass
+    
+    # abbreviations first - where two books share one, the later book wins,
+    # then full names, which always take priority over an abbreviation
+    index = {}
+    for i, book in enumerate(canon(translation)):
+        for abbr in book['abbrs']:
+            index[abbr] = i + 1
+    for i, book in enumerate(canon(translation)):
+        index[book['name'].lower()] = i + 1
+    
+    return _book_indexes.setdefault(translation, (index, sorted(index)))
+
+def _normalize_book(name):
+    """Normalize a book name or abbreviation for lookup in the index"""
+    
+    return ' '.join(name.rstrip('.').lower().split())
+
+def find_book(name, prefix=False, translation=None):
+    """Return the number (1-66) of the book with the given name or
+    abbreviation, or None if there is no such book
+    
+    If prefix is True and there is no exact match, a partial name is
+    accepted as long as it only matches one book (e.g. "phile")"""
+    
+    index = _book_index(translation)[0]
+    name = _normalize_book(name)
+    
+    book = index.get(name)
+    if book is None and prefix and name:
+        books = match_books(name, translation)
+        if len(books) == 1:
+            book = books[0]
+    return book
+
+def match_books(prefix, translation=None):
+    """Return the numbers of all books with a name or abbreviation that
+    starts with prefix, in canonical order - useful for autocompletion"""
+    
+    index, keys = _book_index(translation)
+    prefix = _normalize_book(prefix)
+    
+    # the keys are sorted, so all matches are in one run starting at prefix
+    books = set()
+    for i in range(bisect.bisect_left(keys, prefix), len(keys)):
+        if not keys[i].startswith(prefix):
+            break
+        books.add(index[keys[i]])
+    return sorted(books)
+
+
+# ordinal lookup tables for each translation - see ordinal_tables()
+_ordinal_tables = {}
+
+def ordinal_tables(translation=None):
+    """Return the tables used to convert between verses and ordinals
+    
+    A verse's ordinal is its index in the canon, counting every verse of
+    every chapter from 0 (Genesis 1:1) - omitted verses keep their place, so
+    the ordinal of a verse is the same in every translation that has the
+    same books (see register_translation). Returns a
+    tuple of (chapter_ordinals, starts, chapters, total) where:
+    
+    chapter_ordinals - chapter_ordinals[book-1][chapter-1] is the ordinal of
+                       the first verse of the chapter
+    starts           - the ordinal of the first verse of every chapter, sorted
+    chapters         - the (book, chapter) for each entry in starts
+    total            - the number of verses in the canon"""
+    
+    translation = _books_key(translation)
+    try:
+        return _ordinal_tables[translation]
+    except KeyError:
+        pass
+    
+    chapter_ordinals = []
+    starts = []
+    chapters = []
+    total = 0
+    for b, book in enumerate(canon(translation)):
+        book_ordinals = []
+        for c, count in enumerate(book['verse_counts']):
+            book_ordinals.append(total)
+            starts.append(total)
+            chapters.append((b + 1, c + 1))
+            total += count
+        chapter_ordinals.append(tuple(book_ordinals))
+    
+    tables = (tuple(chapter_ordinals), tuple(starts), tuple(chapters), total)
+    return _ordinal_tables.setdefault(translation, tables)
+
+def ordinal(book, chapter, verse, translation=None):
+    """Return the ordinal for a verse - the verse is not checked, so make
+    sure it exists (Verse does this) before relying on the result"""
+    
+    return ordinal_tables(translation)[0][book - 1][chapter - 1] + verse - 1
+
+def reference(ordinal, translation=None):
+    """Return the (book, chapter, verse) for an ordinal, or None if the
+    ordinal is out of range"""
+    
+    chapter_ordinals, starts, chapters, total = ordinal_tables(translation)
+    if not 0 <= ordinal < total:
+        return None
+    i = bisect.bisect_right(starts, ordinal) - 1
+    book, chapter = chapters[i]
+    return book, chapter, ordinal - starts[i] + 1
+
+
+# sorted ordinals of the omitted verses in each translation - see rank()
+_omitted_ordinals = {}
+
+def omitted_ordinals(translation=None):
+    """Return a sorted tuple of the ordinals of verses omitted from a translation"""
+    
+    translation = _key(translation)
+    try:
+        return _omitted_ordinals[translation]
+    except KeyError:
+        pass
+    
+    omitted = []
+    chapter_ordinals = ordinal_tables(translation)[0]
+    for b, book in enumerate(canon(translation)):
+        for c, verses in enumerate(book.get('omissions', ())):
+            for v in verses:
+                omitted.append(chapter_ordinals[b][c] + v - 1)
+    
+    return _omitted_ordinals.setdefault(translation, tuple(sorted(set(omitted))))
+
+def rank(ordinal, translation=None):
+    """Return the number of verses before an ordinal that are not omitted
+    from the translation - the number of verses from ordinal a up to (but
+    not including) ordinal b is rank(b) - rank(a)"""
+    
+    return ordinal - bisect.bisect_left(omitted_ordinals(translation), ordinal)
+
+def unrank(rank, translation=None):
+    """Return the ordinal of the verse with a rank (see rank) - the ordinal
+    of the rank+1th verse that is not omitted from the translation. The
+    rank is not checked, so make sure it is less than rank(total)"""
+    
+    # each pass skips the omitted verses up to the last guess, and there
+    # are only a few runs of omitted verses, so this settles quickly
+    omitted = omitted_ordinals(translation)
+    ordinal = rank
+    while True:
+        guess = rank + bisect.bisect_right(omitted, ordinal)
+        if guess == ordinal:
+            return ordinal
+        ordinal = guess
+
+def verse_count(book, chapter=None, translation=None):
+    """Return the number of verses in a book, or in one chapter of a book,
+    leaving out verses omitted from the translation"""
+    
+    chapter_ordinals, starts, chapters, total = ordinal_tables(translation)
+    if chapter:
+        first = chapter_ordinals[book - 1][chapter - 1]
+        last = first + canon(translation)[book - 1]['verse_counts'][chapter - 1]
+    else:
+        first = chapter_ordinals[book - 1][0]
+        last = chapter_ordinals[book][0] if book < len(chapter_ordinals) else total
+    return rank(last, translation) - rank(first, translation)
+
+def book_names(translation=None):
+    """Return a dict of every lowercase book name and abbreviation, mapped
+    to the number of the book it refers to (the index used by find_book)"""
+    
+    return dict(_book_index(translation)[0])
+
+
+# ordinal mapping tables between pairs of translations - see mapping_table()
+_mapping_tables = {}
+
+def mapping_table(source, target):
+    """Return a table that maps ordinals in the source translation to the
+    ordinals of the same verses in the target translation
+    
+    table[ordinal] is the target ordinal, or -1 if the verse is omitted
+    from the target (or the target has no such verse). Books are matched by
+    name, so this also works between translations with different books
+    (see register_translation). The table is an array of ints, built the
+    first time it is asked for and shared after that - don't change it."""
+    
+    source = _key(source)
+    target = _key(target)
+    try:
+        return _mapping_tables[source, target]
+    except KeyError:
+        pass
+    
+    # translations with the same books share their ordinals, so only the
+    # verses omitted from the target need to be taken out
+    source_settings = _translations.get(source) or {}
+    target_settings = _translations.get(target) or {}
+    if not source_settings.get('books') and not target_settings.get('books'):
+        table = array.array('i', range(ordinal_tables(source)[3]))
+        for o in omitted_ordinals(target):
+            table[o] = -1
+    
+    # otherwise look up each verse in the target's book of the same name
+    else:
+        target_books = {}
+        for b, book in enumerate(canon(target)):
+            target_books.setdefault(book['name'].lower(), b)
+        target_ordinals = ordinal_tables(target)[0]
+        omitted = set(omitted_ordinals(target))
+        table = array.array('i')
+        for book in canon(source):
+            b = target_books.get(book['name'].lower())
+            counts = canon(target)[b]['verse_counts'] if b is not None else ()
+            for c, count in enumerate(book['verse_counts']):
+                if c < len(counts):
+                    first = target_ordinals[b][c]
+                    table.extend(first + v if v < counts[c] and first + v not in omitted else -1
+                                 for v in range(count))
+                else:
+                    table.extend([-1] * count)
+    return _mapping_tables.setdefault((source, target), table)
+
+def map_ordinal(ordinal, source, target):
+    """Return the ordinal in the target translation of the verse with an
+    ordinal in the source translation, or None if the target omits it"""
+    
+    table = mapping_table(source, target)
+    if not 0 <= ordinal < len(table) or table[ordinal] < 0:
+        return None
+    return table[ordinal]
+
+def map_ordinals(ordinals, source, target):
+    """Return a list of the target ordinals for many source ordinals, with
+    None for verses the target omits - see map_ordinal()"""
+    
+    table = mapping_table(source, target)
+    size = len(table)
+    return [table[o] if 0 <= o < size and table[o] >= 0 else None for o in ordinals]
@@ -1,12 +1,78 @@
 from django import forms
 from django.db import models
 from django.core import exceptions
-from __init__ import Verse, RangeError
+
+try:
+    from . import data
+    from . import Verse, Passage, RangeError, InvalidReference, parse_many
+except (ImportError, ValueError):
+    # imported from inside the package directory, not as part of the package
+    import data
+    from __init__ import Verse, Passage, RangeError, InvalidReference, parse_many
+
+def validate_verses(values):
+    """Validate and normalize a whole column of verse values at once - each
+    value can be a Verse, a verse string, or None (or '') for no verse
+    
+    Returns (verses, errors) - the Verse (or None) for each value, and a
+    dict of the error message for each invalid value, by its index. Strings
+    are parsed in one pass with parse_many, so normalized strings take the
+    fast path and every value shares the same canon data"""
+    
+    verses = [None if value == '' else value for value in values]
+    rows = [i for i, value in enumerate(verses)
+            if value is not None and not isinstance(value, Verse)]
+    errors = {}
+    for i, item in zip(rows, parse_many([verses[i] for i in rows], errors='collect')):
+        if isinstance(item, InvalidReference):
+            errors[i] = item.message
+            verses[i] = None
+        else:
+            verses[i] = item
+    return verses, errors
+
+def clean_verses(values):
+    """Return the Verse (or None) for each value in a column, like
+    validate_verses, but raise a ValidationError listing every invalid row"""
+    
+    verses, errors = validate_verses(values)
+    if errors:
+        raise exceptions.ValidationError(
+            ['Row %s: %s' % (i + 1, errors[i]) for i in sorted(errors)])
+    return verses
+
+def bulk_clean(instances, *field_names):
+    """Validate the verse fields of many model instances at once (e.g.
+    before bulk_create), replacing each value with its Verse - raises a
+    ValidationError with the invalid rows for each field, and leaves the
+    instances as they were, if any value is invalid"""
+    
+    instances = list(instances)
+    errors = {}
+    columns = {}
+    for name in field_names:
+        verses, field_errors = validate_verses([getattr(obj, name) for obj in instances])
+        columns[name] = verses
+        if field_errors:
+            errors[name] = ['Row %s: %s' % (i + 1, field_errors[i]) for i in sorted(field_errors)]
+    if errors:
+        raise exceptions.ValidationError(errors)
+    for name, verses in columns.items():
+        for obj, verse in zip(instances, verses):
+            setattr(obj, name, verse)
+    return instances
+
 
 class VerseFormField(forms.Field):
     def clean(self, value):
         """Form field for custom validation entering verses"""
         
+        # normalized strings (e.g. initial data from the database) don't
+        # need the free text parsing
+        verse = Verse.from_normalized(value)
+        if verse is not None:
+            return str(verse)
+        
         try:
             verse = Verse(value)
         except (RangeError, Exception) as err:
@@ -16,30 +82,54 @@ class VerseFormField(forms.Field):
         return str(verse)
 
 
+class VerseListFormField(forms.CharField):
+    """Form field for entering many verses, one per line - every line is
+    checked at once, and the errors for all of the bad lines are shown"""
+    
+    widget = forms.Textarea
+    
+    def clean(self, value):
+        value = super(VerseListFormField, self).clean(value)
+        lines = [line for line in (value or '').splitlines() if line.strip()]
+        return [str(verse) for verse in clean_verses(lines)]
+
+
 class VerseField(models.Field):
     description = "A scripture reference to a specific verse"
     empty_strings_allowed = False
-    __metaclass__ = models.SubfieldBase
+    __metaclass__ = getattr(models, 'SubfieldBase', type)
     
     def __init__(self, *args, **kwargs):
         kwargs['max_length'] = 104
         super(VerseField, self).__init__(*args, **kwargs)
     
-    def db_type(self):
+    def db_type(self, connection=None):
             return 'char(%s)' % self.max_length
     
     def get_internal_type(self):
         return "VerseField"
     
     def to_python(self, value):
-        if value is None:
+        if value is None or isinstance(value, Verse):
             return value
         
+        # values loaded from the database are normalized strings, so try the
+        # fast path first - anything else gets parsed (and errors reported)
+        verse = Verse.from_normalized(value)
+        if verse is not None:
+            return verse
+        
         try:
             return Verse(value)
         except (RangeError, Exception) as err:
             raise forms.ValidationError(err.__str__())
     
+    def from_db_value(self, value, *args):
+        # values from the database were normalized when they were saved
+        if value is None:
+            return value
+        return Verse.from_normalized(value) or self.to_python(value)
+    
     def get_db_prep_lookup(self, lookup_type, value):
         # For "__book", "__chapter", and "__verse" lookups, convert the value
         # to an int so the database backend always sees a consistent type.
@@ -47,8 +137,10 @@ class VerseField(models.Field):
             return [int(value)]
         return super(VerseField, self).get_db_prep_lookup(lookup_type, value)
     
-    def get_db_prep_value(self, value):
+    def get_db_prep_value(self, value, *args, **kwargs):
         # Casts dates into a string for saving to db
+        if value is None:
+            return value
         return str(value)
     
     def value_to_string(self, obj):
@@ -58,4 +150,225 @@ class VerseField(models.Field):
     def formfield(self, **kwargs):
         defaults = {'form_class': VerseFormField}
         defaults.update(kwargs)
-        return super(VerseField, self).formfield(**defaults)
\ No newline at end of file
+        return super(VerseField, self).formfield(**defaults)
+
+
+# passages are stored in one integer as (start ordinal << 16) + end ordinal,
+# so they sort by start verse and the end can be read back with a modulo
+_passage_shift = 1 << 16
+
+def _reference(ordinal, translation):
+    """Return the Verse for a stored ordinal in a translation"""
+    
+    ref = data.reference(ordinal, translation)
+    if ref is None:
+        raise ValueError('Ordinal %r is not a verse in the translation' % (ordinal,))
+    return Verse._from_parts(ref[0], ref[1], ref[2], translation)
+
+def _check_packing(translation):
+    """Make sure every ordinal in a translation fits in the low bits of a
+    packed passage"""
+    
+    if data.ordinal_tables(translation)[3] > _passage_shift:
+        raise ValueError('The translation has too many verses to store passages as packed ordinals')
+
+def _verse(value, translation):
+    """Return a Verse in the translation for a Verse or verse string"""
+    
+    if not isinstance(value, Verse):
+        value = Verse(value)
+    if value.translation != translation:
+        value = value.to_translation(translation)
+    return value
+
+def _bounds(value, translation):
+    """Return the first and last ordinals of a Passage or Verse (or a string
+    for either) in a translation"""
+    
+    if isinstance(value, Passage):
+        value = value.to_translation(translation)
+        return value.start.ordinal, value.end.ordinal
+    if not isinstance(value, Verse):
+        value = Passage.from_normalized(value) or Verse(value)
+        return _bounds(value, translation)
+    ordinal = _verse(value, translation).ordinal
+    return ordinal, ordinal
+
+
+class VerseOrdinalField(models.IntegerField):
+    """A verse stored as its ordinal (see Verse.ordinal) in an indexed
+    integer column, so verses sort in canonical order and range queries use
+    the index. Every verse in the column is in one translation - verses
+    from other translations are converted when they are saved or looked up
+    
+    Use the within lookup to find the verses in a passage:
+        
+        Note.objects.filter(verse__within=Passage('Rom 8:1', 'Rom 8:39'))"""
+    
+    description = "A scripture reference to a specific verse, stored as an ordinal"
+    
+    def __init__(self, *args, **kwargs):
+        self.translation = kwargs.pop('translation', None)
+        kwargs.setdefault('db_index', True)
+        super(VerseOrdinalField, self).__init__(*args, **kwargs)
+    
+    def deconstruct(self):
+        name, path, args, kwargs = super(VerseOrdinalField, self).deconstruct()
+        if self.translation:
+            kwargs['translation'] = self.translation
+        return name, path, args, kwargs
+    
+    def from_db_value(self, value, *args):
+        if value is None:
+            return value
+        return _reference(value, self.translation)
+    
+    def to_python(self, value):
+        if value is None or isinstance(value, Verse):
+            return value
+        try:
+            if isinstance(value, int):
+                return self.from_db_value(value)
+            return _verse(value, self.translation)
+        except (RangeError, Exception) as err:
+            raise exceptions.ValidationError(err.__str__())
+    
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, int):
+            return value
+        return _verse(value, self.translation).ordinal
+    
+    def run_validators(self, value):
+        # the integer range validators check the stored ordinal
+        super(VerseOrdinalField, self).run_validators(self.get_prep_value(value))
+    
+    def value_to_string(self, obj):
+        return str(self.value_from_object(obj))
+    
+    def formfield(self, **kwargs):
+        defaults = {'form_class': VerseFormField}
+        defaults.update(kwargs)
+        return super(VerseOrdinalField, self).formfield(**defaults)
+
+
+class PassageOrdinalField(models.BigIntegerField):
+    """A passage stored in an indexed integer column as its start and end
+    ordinals (see Verse.ordinal) packed together, so passages sort by start
+    verse and range queries use the index. Every passage in the column is
+    in one translation, like VerseOrdinalField
+    
+    Lookups take a Passage or Verse (or a string for one):
+        
+        Reading.objects.filter(passage__within=Passage('Rom 1:1', 'Rom 8:39'))
+        Reading.objects.filter(passage__contains=Verse('Rom 8:28'))
+        Reading.objects.filter(passage__overlaps=Passage('Rom 8:1', 'Rom 9:5'))"""
+    
+    description = "A passage of scripture, stored as packed ordinals"
+    
+    def __init__(self, *args, **kwargs):
+        self.translation = kwargs.pop('translation', None)
+        kwargs.setdefault('db_index', True)
+        super(PassageOrdinalField, self).__init__(*args, **kwargs)
+    
+    def deconstruct(self):
+        name, path, args, kwargs = super(PassageOrdinalField, self).deconstruct()
+        if self.translation:
+            kwargs['translation'] = self.translation
+        return name, path, args, kwargs
+    
+    def from_db_value(self, value, *args):
+        if value is None:
+            return value
+        return Passage(_reference(value // _passage_shift, self.translation),
+                       _reference(value % _passage_shift, self.translation))
+    
+    def to_python(self, value):
+        if value is None or isinstance(value, Passage):
+            return value
+        if isinstance(value, int):
+            try:
+                return self.from_db_value(value)
+            except ValueError as err:
+                raise exceptions.ValidationError(err.__str__())
+        if isinstance(value, Verse):
+            return Passage(value, value)
+        passage = Passage.from_normalized(value)
+        if passage is None:
+            raise exceptions.ValidationError("We can't make sense of your passage: %r" % (value,))
+        return passage
+    
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, int):
+            return value
+        _check_packing(self.translation)
+        first, last = _bounds(self.to_python(value), self.translation)
+        return first * _passage_shift + last
+    
+    def run_validators(self, value):
+        # the integer range validators check the stored ordinal
+        super(PassageOrdinalField, self).run_validators(self.get_prep_value(value))
+    
+    def value_to_string(self, obj):
+        return str(self.value_from_object(obj))
+
+
+class _OrdinalLookup(models.Lookup):
+    """A lookup that takes a Passage or Verse, and compares the first and
+    last ordinals of it with the column - the value is not prepared by the
+    field, as it is not a value for the column itself"""
+    
+    prepare_rhs = False
+    
+    def as_sql(self, compiler, connection):
+        lhs, params = self.process_lhs(compiler, connection)
+        first, last = _bounds(self.rhs, self.lhs.output_field.translation)
+        sql, rhs_params = self.ordinal_sql(lhs, first, last)
+        return sql, list(params) + rhs_params
+
+
+class _VerseWithin(_OrdinalLookup):
+    lookup_name = 'within'
+    
+    def ordinal_sql(self, lhs, first, last):
+        return '%s BETWEEN %%s AND %%s' % lhs, [first, last]
+
+
+class _PassageLookup(_OrdinalLookup):
+    """A lookup on the packed ordinals of a PassageOrdinalField"""
+    
+    def as_sql(self, compiler, connection):
+        _check_packing(self.lhs.output_field.translation)
+        return super(_PassageLookup, self).as_sql(compiler, connection)
+
+
+class _PassageWithin(_PassageLookup):
+    lookup_name = 'within'
+    
+    def ordinal_sql(self, lhs, first, last):
+        # the passage starts in the range, and doesn't end after it
+        return ('%s BETWEEN %%s AND %%s AND %s %%%% %%s <= %%s' % (lhs, lhs),
+                [first * _passage_shift, last * _passage_shift + last, _passage_shift, last])
+
+
+class _PassageContains(_PassageLookup):
+    lookup_name = 'contains'
+    
+    def ordinal_sql(self, lhs, first, last):
+        # the passage starts before the first verse, and doesn't end before the last
+        return ('%s <= %%s AND %s %%%% %%s >= %%s' % (lhs, lhs),
+                [first * _passage_shift + _passage_shift - 1, _passage_shift, last])
+
+
+class _PassageOverlaps(_PassageLookup):
+    lookup_name = 'overlaps'
+    
+    def ordinal_sql(self, lhs, first, last):
+        # the passage starts before the last verse, and doesn't end before the first
+        return ('%s <= %%s AND %s %%%% %%s >= %%s' % (lhs, lhs),
+                [last * _passage_shift + _passage_shift - 1, _passage_shift, first])
+
+
+VerseOrdinalField.register_lookup(_VerseWithin)
+PassageOrdinalField.register_lookup(_PassageWithin)
+PassageOrdinalField.register_lookup(_PassageContains)
+PassageOrdinalField.register_lookup(_PassageOverlaps)
@@ -0,0 +1,149 @@
+import re
+import collections
+
+try:
+    from . import data
+    from . import Verse, Passage, RangeError
+except (ImportError, ValueError):
+    # imported from inside the package directory, not as part of the package
+    import data
+    from __init__ import Verse, Passage, RangeError
+
+# a reference found by extract() - the Verse or Passage, and the offsets of
+# the text it was found in (text[start:end])
+Match = collections.namedtuple('Match', 'reference start end')
+
+# the longest a reference can be - used to carry text over between chunks
+_max_length = 100
+
+# the (pattern, books) built by _compile() for each translation's books
+_compiled = {}
+
+def _compile(translation=None):
+    """Return one regular expression matching a reference to any book in a
+    translation, by name or abbreviation, and a dict to look up the book
+    for each - built the first time they are needed"""
+    
+    key = data._books_key(translation)
+    try:
+        return _compiled[key]
+    except KeyError:
+        pass
+    
+    # the same book can be written with or without a space after a number
+    # or between words (e.g. "1 Cor" or "1Cor"), so look books up without
+    # their spaces
+    books = {}
+    names = data.book_names(key)
+    for name, book in names.items():
+        books.setdefault(name.replace(' ', ''), book)
+    
+    # build a trie of the names, so the expression can rule out most text
+    # after one character rather than trying every name in turn - any
+    # amount of space can go between the words of a name
+    trie = {}
+    for name in names:
+        tokens = [r'\s*' if c == ' ' else c for c in ' '.join(name.split())]
+        if tokens[0].isdigit() and tokens[1:2] != [r'\s*']:
+            tokens.insert(1, r'\s*')
+        node = trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node[''] = True
+    
+    pattern = re.compile(
+        r'(?<![A-Za-z0-9])(%s)\.?\s*(\d{1,3}):(\d{1,3})(?!\d)'
+        r'(?:\s*-\s*(?:(\d{1,3}):)?(\d{1,3})(?![\d:]))?' % _trie_pattern(trie),
+        re.IGNORECASE)
+    return _compiled.setdefault(key, (pattern, books))
+
+data.add_reset_hook(_compiled.clear)
+
+def _trie_pattern(node):
+    """Return a regular expression matching every name in a trie of tokens"""
+    
+    alternatives = []
+    for token in sorted(node, reverse=True):
+        if token:
+            part = token if token == r'\s*' else re.escape(token)
+            alternatives.append(part + _trie_pattern(node[token]))
+    
+    # a name ending here makes the rest optional (longer names are preferred)
+    if not alternatives:
+        return ''
+    if len(alternatives) == 1:
+        pattern = alternatives[0]
+    else:
+        pattern = '(?:%s)' % '|'.join(alternatives)
+    if '' in node:
+        pattern = '(?:%s)?' % pattern
+    return pattern
+
+def _reference(match, books, translation):
+    """Return the Verse or Passage for a match, or None if it is not valid"""
+    
+    book = books[re.sub(r'\s', '', match.group(1)).lower()]
+    chapter, verse = int(match.group(2)), int(match.group(3))
+    try:
+        start = Verse(book, chapter, verse, translation)
+        if match.group(5) is None:
+            return start
+        end = Verse(book, int(match.group(4) or chapter), int(match.group(5)), translation)
+    except RangeError:
+        return None
+    if end < start:
+        return None
+    return Passage(start, end)
+
+def extract(text, translation=None):
+    """Find every scripture reference in a string, yielding a Match of the
+    Verse or Passage and its offsets for each one, in order
+    
+    References are a book name or abbreviation with chapter:verse, and an
+    optional range - e.g. "Rom. 8:28", "1 John 1:9-10" or "Gen 1:1 - 2:3".
+    References to verses that do not exist are skipped."""
+    
+    pattern, books = _compile(translation)
+    for match in pattern.finditer(text):
+        reference = _reference(match, books, translation)
+        if reference is not None:
+            yield Match(reference, match.start(), match.end())
+
+def extract_stream(stream, translation=None, chunk_size=65536):
+    """Find every scripture reference in a text stream (like an open file),
+    reading it chunk_size characters at a time - see extract()
+    
+    Offsets are counted from the start of the stream."""
+    
+    pattern, books = _compile(translation)
+    text = ''
+    offset = 0
+    pos = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        text += chunk
+        
+        # only take matches that can't continue into the next chunk
+        if chunk:
+            cut = len(text) - _max_length
+        else:
+            cut = len(text)
+        
+        for match in pattern.finditer(text, pos):
+            if chunk and match.start() >= cut:
+                break
+            pos = match.end()
+            reference = _reference(match, books, translation)
+            if reference is not None:
+                yield Match(reference, offset + match.start(), offset + match.end())
+        
+        if not chunk:
+            return
+        
+        # keep the rest of the text (and one character before it, to check
+        # the start of the next reference) for the next chunk
+        pos = max(pos, cut)
+        keep = max(pos - 1, 0)
+        text = text[keep:]
+        offset += keep
+        pos -= keep
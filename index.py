@@ -0,0 +1,169 @@
+import bisect
+
+try:
+    from . import data
+except (ImportError, ValueError):
+    # imported from inside the package directory, not as part of the package
+    import data
+
+
+class PassageIndex(object):
+    """A collection of Passage objects that can quickly find the passages
+    containing a verse, overlapping a range of verses, or nearest a verse
+    
+    Passages are kept sorted by start verse in an implicit interval tree
+    (each node also knows the furthest end verse below it), so queries take
+    O(log n + k) time for k results. Passages can be loaded all at once:
+        
+        index = PassageIndex(reading_plan_passages)
+        index.containing(Verse('Rom 8:28'))
+        index.overlapping(Passage('Rom 8:1', 'Rom 9:5'))
+        index.nearest(Verse('Rom 8:28'))"""
+    
+    def __init__(self, passages=()):
+        self._pending = list(passages)
+        self._passages = []
+        self._starts = []
+        self._ends = []
+        self._max_ends = []
+        self._by_end = []
+        self._sorted_ends = []
+    
+    def add(self, passage):
+        """Add a passage to the index"""
+        self._pending.append(passage)
+    
+    def update(self, passages):
+        """Add every passage from an iterable to the index"""
+        self._pending.extend(passages)
+    
+    def __len__(self):
+        return len(self._passages) + len(self._pending)
+    
+    def __iter__(self):
+        """Iterate over the passages in order of their start verses"""
+        self._build()
+        return iter(self._passages)
+    
+    def _build(self):
+        """Rebuild the tree if passages have been added since the last query"""
+        
+        if not self._pending:
+            return
+        
+        # sort all of the passages by start (then end) ordinal
+        items = [(p.start.ordinal, p.end.ordinal, p) for p in self._pending]
+        items.extend(zip(self._starts, self._ends, self._passages))
+        items.sort(key=lambda item: (item[0], item[1]))
+        self._pending = []
+        self._starts = [item[0] for item in items]
+        self._ends = [item[1] for item in items]
+        self._passages = [item[2] for item in items]
+        self._by_end = sorted(range(len(items)), key=self._ends.__getitem__)
+        self._sorted_ends = [self._ends[i] for i in self._by_end]
+        
+        # store the furthest end of each node at its midpoint
+        self._max_ends = list(self._ends)
+        self._build_node(0, len(items))
+    
+    def _build_node(self, lo, hi):
+        """Set and return the furthest end ordinal for the node [lo, hi)"""
+        
+        mid = (lo + hi) // 2
+        max_end = self._ends[mid]
+        if lo < mid:
+            max_end = max(max_end, self._build_node(lo, mid))
+        if mid + 1 < hi:
+            max_end = max(max_end, self._build_node(mid + 1, hi))
+        self._max_ends[mid] = max_end
+        return max_end
+    
+    def _search(self, first, last):
+        """Return the positions of passages overlapping ordinals first to last"""
+        
+        starts, ends, max_ends = self._starts, self._ends, self._max_ends
+        found = []
+        nodes = [(0, len(starts))] if starts else []
+        while nodes:
+            lo, hi = nodes.pop()
+            mid = (lo + hi) // 2
+            
+            # nothing in this node reaches the range
+            if max_ends[mid] < first:
+                continue
+            if lo < mid:
+                nodes.append((lo, mid))
+            
+            # passages at and after the midpoint start after the range
+            if starts[mid] > last:
+                continue
+            if ends[mid] >= first:
+                found.append(mid)
+            if mid + 1 < hi:
+                nodes.append((mid + 1, hi))
+        
+        found.sort()
+        return found
+    
+    def containing(self, verse):
+        """Return a list of the passages that include a verse, in order -
+        like Passage.__contains__, verses omitted from a passage's
+        translation are not included in it"""
+        
+        self._build()
+        ordinal = verse.ordinal
+        found = []
+        for i in self._search(ordinal, ordinal):
+            passage = self._passages[i]
+            translation = passage.start.translation
+            if translation and ordinal in data.omitted_ordinals(translation):
+                continue
+            found.append(passage)
+        return found
+    
+    def overlapping(self, reference):
+        """Return a list of the passages that share at least one verse with
+        a Passage (or include a single Verse), in order"""
+        
+        self._build()
+        first, last = _ordinal_range(reference)
+        return [self._passages[i] for i in self._search(first, last)]
+    
+    def nearest(self, verse):
+        """Return the passage closest to a verse - a passage containing the
+        verse if there is one, otherwise the passage that ends or starts
+        fewest verses away. Returns None if the index is empty"""
+        
+        self._build()
+        if not self._passages:
+            return None
+        found = self.containing(verse)
+        if found:
+            return found[0]
+        
+        # the closest passage ending before the verse
+        ordinal = verse.ordinal
+        best = None
+        i = bisect.bisect_left(self._sorted_ends, ordinal) - 1
+        if i >= 0:
+            best = self._by_end[i]
+            distance = ordinal - self._sorted_ends[i]
+        
+        # the closest passage starting after the verse
+        i = bisect.bisect_right(self._starts, ordinal)
+        if i < len(self._starts) and (best is None or self._starts[i] - ordinal < distance):
+            best = i
+        
+        # fall back on the overlapping passage that omits the verse
+        if best is None:
+            best = self._search(ordinal, ordinal)[0]
+        return self._passages[best]
+
+
+def _ordinal_range(reference):
+    """Return the (first, last) ordinals covered by a Verse or Passage"""
+    
+    try:
+        return reference.start.ordinal, reference.end.ordinal
+    except AttributeError:
+        return reference.ordinal, reference.ordinal
@@ -0,0 +1,209 @@
+# Opt-in instrumentation - counts and times the hot paths (parsing, validation,
+# formatting, passage math, and the canon data behind them) by phase
+#
+# Nothing is measured until enable() is called: it replaces the functions for
+# each phase with timed versions, and disable() puts the originals back, so
+# there is no cost at all while instrumentation is off.
+
+import sys
+import time
+import bisect
+import functools
+
+# the bible module itself, whose functions are timed
+_package = __name__.rpartition('.')[0]
+if _package:
+    from . import data
+    _bible = sys.modules[_package]
+else:
+    # imported from inside the package directory, not as part of the package
+    import data
+    import __init__ as _bible
+
+# the most precise timer available
+_timer = getattr(time, 'perf_counter', time.time)
+
+# upper bounds of the histogram buckets, in seconds - the last bucket has no
+# upper bound
+bounds = (1e-6, 2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4,
+          1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 0.1)
+
+
+class Histogram(object):
+    """Counts how many times a phase ran, the total time, and how many runs
+    fell in each of the buckets set by bounds"""
+    
+    __slots__ = ('count', 'total', 'buckets')
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(bounds) + 1)
+    
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.buckets[bisect.bisect_left(bounds, seconds)] += 1
+    
+    def as_dict(self):
+        """Return the counts as a dict that can be saved as JSON - buckets
+        is a list of [upper bound in seconds (None for no bound), count]"""
+        
+        return {
+            'count': self.count,
+            'total_seconds': self.total,
+            'buckets': [[bound, n] for bound, n in zip(bounds + (None,), self.buckets)],
+        }
+
+
+def _targets():
+    """Return (phase, owner, attribute name) for each function to time"""
+    
+    Verse, Passage, PassageSet = _bible.Verse, _bible.Passage, _bible.PassageSet
+    return [
+        ('canon', data, 'bible_data'),
+        ('books', data, 'find_book'),
+        ('parse', _bible, '_parse_reference'),
+        ('regex', _bible, 'verse_re'),
+        ('regex', _bible, 'book_re'),
+        ('regex', _bible, 'ref_re'),
+        ('regex', _bible, 'translation_re'),
+        ('validate', _bible, '_check_reference'),
+        ('format', Verse, 'format'),
+        ('format', Passage, 'format'),
+        ('format', PassageSet, 'format'),
+        ('format', _bible, 'format_many'),
+        ('passage', Verse, 'offset'),
+        ('passage', Passage, '__len__'),
+        ('passage', Passage, '__contains__'),
+        ('passage', Passage, 'to_translation'),
+        ('passage', PassageSet, '__len__'),
+        ('passage', PassageSet, '__contains__'),
+        ('passage', PassageSet, 'union'),
+        ('passage', PassageSet, 'intersection'),
+        ('passage', PassageSet, 'difference'),
+    ]
+
+# the phases that can be measured - compiling format strings is counted by
+# the misses of the format cache (see snapshot())
+phases = ('canon', 'books', 'parse', 'regex', 'validate', 'format', 'passage')
+
+_histograms = {}
+_sinks = []
+_originals = []
+
+def _record(phase, seconds):
+    _histograms[phase].observe(seconds)
+    for sink in _sinks:
+        sink(phase, seconds)
+
+def _timed(function, phase):
+    """Return a version of function that records how long each call takes"""
+    
+    timer = _timer
+    
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start = timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _record(phase, timer() - start)
+    return timed
+
+
+class _TimedPattern(object):
+    """Wraps a regular expression so that its searches are timed"""
+    
+    def __init__(self, pattern, phase):
+        self.pattern = pattern
+        self.search = _timed(pattern.search, phase)
+        self.match = _timed(pattern.match, phase)
+    
+    def __getattr__(self, name):
+        return getattr(self.pattern, name)
+
+
+def enable(only=None):
+    """Start timing every phase (or the phases named in only) - calling it
+    again changes which phases are timed. Phases can include each other
+    (formatting a PassageSet formats its passages), so times overlap"""
+    
+    disable()
+    for phase, owner, name in _targets():
+        if only and phase not in only:
+            continue
+        _histograms.setdefault(phase, Histogram())
+        
+        # look up class attributes without binding methods
+        original = owner.__dict__[name] if isinstance(owner, type) else getattr(owner, name)
+        if name.endswith('_re'):
+            replacement = _TimedPattern(original, phase)
+        else:
+            replacement = _timed(original, phase)
+        _originals.append((owner, name, original))
+        setattr(owner, name, replacement)
+
+def disable():
+    """Stop timing, putting the original functions back - the counts so
+    far are kept until reset()"""
+    
+    while _originals:
+        owner, name, original = _originals.pop()
+        setattr(owner, name, original)
+
+def enabled():
+    """Return True if any phases are being timed"""
+    return bool(_originals)
+
+def reset():
+    """Throw away the counts and times for every phase"""
+    
+    for phase in _histograms:
+        _histograms[phase] = Histogram()
+
+def add_sink(function):
+    """Call function(phase, seconds) for every timed call, e.g. to send the
+    times on to a statsd client or a tracing library"""
+    
+    _sinks.append(function)
+
+def remove_sink(function):
+    """Stop sending times to a sink added with add_sink()"""
+    
+    _sinks.remove(function)
+
+def _cache_stats(cache):
+    """Return the counts of an LRU cache, or None if there is no cache (the
+    parse cache is off)"""
+    
+    if cache is None:
+        return None
+    return {'hits': cache.hits,
+            'misses': cache.misses,
+            'size': len(cache),
+            'maxsize': cache.maxsize}
+
+def snapshot(reset_counts=False):
+    """Return the counts and times for each phase, and the hits and misses
+    of the format and parse caches, as a dict that can be saved as JSON:
+        
+        {'enabled': True,
+         'phases': {'parse': {'count': ..., 'total_seconds': ..., 'buckets': [...]}, ...},
+         'caches': {'format': {'hits': ..., 'misses': ..., 'size': ..., 'maxsize': ...},
+                    'parse': None}}
+    
+    The cache counts are kept whether or not instrumentation is enabled.
+    Set reset_counts to start counting the phases from zero again"""
+    
+    stats = {
+        'enabled': enabled(),
+        'phases': dict((phase, h.as_dict()) for phase, h in _histograms.items()),
+        'caches': {
+            'format': _cache_stats(_bible._format_cache),
+            'parse': _cache_stats(_bible.parse_cache()),
+        },
+    }
+    if reset_counts:
+        reset()
+    return stats